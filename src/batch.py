@@ -0,0 +1,184 @@
+import copy
+import random
+import sys
+import traceback
+from cache import PATH_CACHE
+from server import RecordingVisual
+from workers import WORKER_POOL, WORKER_STATE
+
+INDEPENDENT_KEYWORDS = ("city", "load", "path", "mission")
+CLEARING_KEYWORDS = ("path", "mission") # queries that start with clear_extra
+
+
+def is_console_command(query):
+    """
+    :return: True for the commands handled by the console loop rather than handle_query.
+    """
+    return query == "reload" or query[:4] == "file" or query == "e" or query == "exit"
+
+def is_independent(query):
+    """
+    :return: True if query leaves the owned track, mission cards, log and harbor penalty as they are, so that it can
+        run alongside its neighbours. Saved queries (with an asterisk) never are.
+    """
+    return query.split(' ')[0] in INDEPENDENT_KEYWORDS
+
+def take_batch(queue):
+    """
+    Removes the queued queries up to the next console command from queue.
+
+    :return: list of queries in order.
+    """
+    queries = []
+    while len(queue) > 0 and not is_console_command(queue[0]):
+        queries.append(queue.popleft())
+    return queries
+
+
+def print_result(output, error=None, trace=None):
+    if error is None:
+        if len(output) > 0:
+            print("  >", output)
+    else:
+        sys.stderr.write(trace)
+        print("  > ERROR:", error)
+
+def detach(my_track, log):
+    """
+    :return: copies of my_track, with an empty queue, and log without their board and database, which workers
+        already hold.
+    """
+    my_track, log = copy.copy(my_track), copy.copy(log)
+    my_track.orig_board, my_track.database, log.database = None, None, None
+    my_track.queued_track = []
+    return my_track, log
+
+def run_batch_query(my_track, log, harbor_penalty, query, state, entries):
+    """
+    Runs one query of a file in a worker process, on my_track and log from detach(), as the console would run it from
+    the given random state and path cache entries.
+
+    :param state: random.getstate() to start from.
+    :param entries: entries of the path cache to start from.
+    :return: tuple (queued track, RecordingVisual, result dictionary, error message or None, random state after the
+        query, journal of the path cache); on error the result holds the traceback.
+    """
+    from main import handle_query
+    database, board = WORKER_STATE["database"], WORKER_STATE["board"]
+    my_track.orig_board, my_track.database, log.database = board, database, database
+    board.harbor_penalty = harbor_penalty
+    random.setstate(state)
+    own_entries = PATH_CACHE.isolate()
+    PATH_CACHE.restore(entries)
+    PATH_CACHE.journal = []
+    visual = RecordingVisual()
+    result = {}
+    error = None
+    log.step()
+    try:
+        result["text"] = handle_query(database, board, my_track, log, visual, WORKER_STATE["results_path"], query,
+                                      result)
+    except Exception as e:
+        error = str(e)
+        result["traceback"] = traceback.format_exc()
+    journal = PATH_CACHE.journal
+    PATH_CACHE.journal = None
+    PATH_CACHE.restore(own_entries)
+    return my_track.queued_track, visual, result, error, random.getstate(), journal
+
+def predict_state(state):
+    """
+    :return: random state after a query that starts from state and only draws the color of its drawings, as city and
+        load queries, and path and mission queries answered from the city matrix or the path cache, do.
+    """
+    from main import random_color
+    current = random.getstate()
+    random.setstate(state)
+    random_color()
+    state = random.getstate()
+    random.setstate(current)
+    return state
+
+
+class BatchRunner:
+    """
+    Runs the queries of a file as the console would, one after the other, except that consecutive independent queries
+    are searched ahead in the shared pool of worker processes.
+
+    A worker runs each query from the random state and path cache entries it is predicted to start from in file order.
+    The results are committed in file order, and only if the query really started from that random state and found
+    the same entries in the path cache; otherwise the query runs again in the console process. The output, drawings,
+    track, random state and path cache are therefore the same as when the queries run one by one.
+    """
+    def __init__(self, database, board, results_path, workers):
+        self.results_path = results_path
+        self.workers = workers
+
+    def run(self, database, board, my_track, log, visual, queries, number):
+        """
+        :param queries: list of queries for handle_query, without console commands.
+        :param number: console number of the first query.
+        :return: console number of the query after the last one.
+        """
+        start = 0
+        while start < len(queries):
+            end = start
+            while end < len(queries) and is_independent(queries[end]):
+                end += 1
+            if self.workers > 1 and end - start > 1:
+                self.run_parallel(database, board, my_track, log, visual, queries[start:end], number)
+            else:
+                end = max(end, start + 1)
+                for k in range(start, end):
+                    self.run_serial(database, board, my_track, log, visual, queries[k], number + k - start)
+            number += end - start
+            start = end
+        return number
+
+    def run_serial(self, database, board, my_track, log, visual, query, number):
+        from main import handle_query
+        log.step()
+        visual.update()
+        print(str(number) + ": " + query)
+        try:
+            print_result(handle_query(database, board, my_track, log, visual, self.results_path, query))
+        except Exception as error:
+            print_result("", str(error), traceback.format_exc())
+
+    def run_parallel(self, database, board, my_track, log, visual, queries, number):
+        """
+        Runs independent queries, which leave the saved track and log as they are, keeping up to twice the number of
+        workers of them in flight.
+        """
+        executor = WORKER_POOL.get(self.workers, board, database, self.results_path)
+        track, log_copy = detach(my_track, log)
+        futures = {}
+        following, state = 0, random.getstate()
+        for k, query in enumerate(queries):
+            if k not in futures: # the prediction failed, search again from the actual state
+                for future, _ in futures.values():
+                    future.cancel()
+                futures = {}
+                following, state = k, random.getstate()
+            while following < len(queries) and len(futures) < 2 * self.workers:
+                futures[following] = (executor.submit(run_batch_query, track, log_copy, board.harbor_penalty,
+                                                      queries[following], state, PATH_CACHE.entries), state)
+                following, state = following + 1, predict_state(state)
+
+            future, start_state = futures.pop(k)
+            queued, recording, result, error, end_state, journal = future.result()
+            if start_state != random.getstate() or not PATH_CACHE.replay(journal):
+                self.run_serial(database, board, my_track, log, visual, query, number + k)
+            else:
+                random.setstate(end_state)
+                log.step()
+                visual.update()
+                print(str(number + k) + ": " + query)
+                recording.replay(visual)
+                if query.split(' ')[0] in CLEARING_KEYWORDS:
+                    my_track.restore_from_log(log)
+                    for path in queued:
+                        my_track.append_to_queue(path)
+                print_result(result.get("text", ""), error, result.get("traceback"))
+            if k + 1 in futures and futures[k + 1][1] != random.getstate():
+                futures.pop(k + 1)[0].cancel()
@@ -0,0 +1,523 @@
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+import board
+import graph
+from cache import PATH_CACHE
+from utils import load_files
+from mytrack import Track, MyTrack
+from log import Log
+
+DEFAULT_DB_PATH = "../database/eurorails.json"
+DEFAULT_BOARD_PATH = "../database/board_ascii.txt"
+DEFAULT_HARBOR_PATH = "../database/harbors.txt"
+DEFAULT_IMG_PATH = "../database/board.jpg"
+
+SUITE_VERSION = 2
+SEED = 0
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.1 # slowdown of the median time reported as a regression
+NAME_WIDTH = 40
+
+CITY_PAIRS = [("paris", "ruhr"), ("madrid", "berlin"), ("lisboa", "stockholm"), ("london", "wien"),
+              ("dublin", "milano"), ("sevilla", "kaliningrad")]
+CONNECT_GROUPS = ["paris", "wien", "coal", "madrid", "oslo", "wine", "napoli", "cattle"]
+MISSION_ALL = [("wine", "stockholm"), ("machinery", "madrid")]
+MISSION_CARDS = [(("wine", "stockholm", "30"), ("coal", "madrid", "40"), ("fish", "wien", "25")),
+                 (("cattle", "london", "20"), ("machinery", "roma", "35"), ("wheat", "oslo", "30")),
+                 (("beer", "lisboa", "30"), ("oranges", "berlin", "28"), ("marble", "paris", "22"))]
+LOG_PATHS = 200
+IMPORTED_MODULES = ("board", "mytrack", "utils", "log", "main", "visual")
+
+
+class Skip(Exception):
+    """
+    Raised by a case whose optional dependencies are missing.
+    """
+
+
+class ListFrontier:
+    """
+    Reference agenda with the cost profile of the old circular LinkedList: every pop scans the whole agenda once to
+    find the minimum and once more to measure its size.
+    """
+    def __init__(self, ties=graph.RANDOM_TIES, rng=None):
+        self.ties = ties
+        self.rng = rng if rng is not None else random
+        self.items = []
+        self.done = set()
+
+    def push(self, key, item, priority):
+        self.items.append((priority, key, item))
+        return True
+
+    def pop(self):
+        while len([entry for entry in self.items]) > 0:
+            min_priority = min(entry[0] for entry in self.items)
+            min_nodes = [i for i in range(len(self.items)) if self.items[i][0] == min_priority]
+            index = self.rng.choice(min_nodes) if self.ties == graph.RANDOM_TIES else min_nodes[0]
+            _, key, item = self.items.pop(index)
+            if key not in self.done:
+                self.done.add(key)
+                return item
+        return None
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ListTrack(Track):
+    """
+    Reference track with the old storage: a list of lists of ints, copied and merged one cell at a time.
+    """
+    def __init__(self, eurorails_board):
+        super().__init__(eurorails_board)
+        self.board = [[0 for _ in range(self.width)] for _ in range(self.height)]
+        self.bits = None
+
+    def read_cell(self, x_index, y_index):
+        if 0 <= x_index < self.width and 0 <= y_index < self.height:
+            return self.board[y_index][x_index]
+        return None
+
+    def write_cell(self, x_index, y_index, value):
+        if 0 <= x_index < self.width and 0 <= y_index < self.height:
+            self.board[y_index][x_index] = value
+
+    def __contains__(self, pt):
+        if len(pt) == 2:
+            return self.read_cell(2 * (pt[0] - self.min_x), 2 * (self.max_y - pt[1]))
+        elif len(pt) == 4:
+            return self.read_cell(2 * (pt[0] - self.min_x) + pt[2], 2 * (self.max_y - pt[1]) - pt[3])
+        return False
+
+    def copy(self):
+        copy = ListTrack(self.orig_board)
+        copy.board = [[self.board[r][c] for c in range(len(self.board[r]))] for r in range(len(self.board))]
+        copy.adjacency = {p: neighbours.copy() for p, neighbours in self.adjacency.items()}
+        copy.representatives = self.representatives.copy()
+        copy.has_track = self.has_track
+        return copy
+
+    def union(self, other):
+        for r in range(len(other.board)):
+            for c in range(len(other.board[r])):
+                if other.board[r][c] == 1:
+                    self.board[r][c] = 1
+        for p, neighbours in other.adjacency.items():
+            self.adjacency.setdefault(p, set()).update(neighbours)
+
+    def clean(self):
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                self.board[r][c] = 0
+        self.has_track = False
+        self.representatives = set()
+        self.adjacency = {}
+
+
+def coords(database, group):
+    """
+    :return: list of the locations of a city, or of every city with a load.
+    """
+    if group in database["loads"]:
+        return [database["cities"][c]["coords"] for c in database["loads"][group]]
+    return [database["cities"][group]["coords"]]
+
+
+def late_game_log(database, eurorails_board, number_paths):
+    """
+    Builds a Log holding number_paths saved paths between random pairs of cities, like the log of a long game.
+    """
+    log = Log(database)
+    cities = sorted(database["cities"])
+    rng = random.Random(0)
+    while len(log.query_log) < number_paths:
+        c1, c2 = rng.sample(cities, 2)
+        goal = database["cities"][c2]["coords"]
+        path, _ = board.find_path(database["cities"][c1]["coords"], eurorails_board, None, lambda p: p == goal,
+                                  ties=graph.DETERMINISTIC_TIES)
+        if path is not None:
+            log.record("path", path)
+            log.step()
+    return log
+
+
+def time_case(setup, run, repeats):
+    """
+    Times run(*setup()) repeats times. setup is not timed, and random is reseeded with SEED before both.
+
+    :return: tuple (list of times in milliseconds, value returned by the last run)
+    """
+    times = []
+    value = None
+    for _ in range(repeats):
+        random.seed(SEED)
+        arguments = setup()
+        random.seed(SEED)
+        start = time.perf_counter()
+        value = run(*arguments)
+        times.append(1000 * (time.perf_counter() - start))
+    return times, value
+
+
+def path_cases(database, eurorails_board):
+    """
+    find_path between each of CITY_PAIRS on an empty board, and over all of them as plain Dijkstra searches with the
+    heap agenda and with the reference ListFrontier.
+    """
+    cases = []
+    for c1, c2 in CITY_PAIRS:
+        def run(start, goal):
+            return board.find_path(start, eurorails_board, None, lambda p: p == goal, goals=[goal])[1]
+        start = database["cities"][c1]["coords"]
+        goal = database["cities"][c2]["coords"]
+        cases.append(("find_path " + c1 + "-" + c2, lambda start=start, goal=goal: (start, goal), run))
+
+    def dijkstra(frontier_class):
+        original_frontier = graph.Frontier
+        graph.Frontier = frontier_class
+        stats = {}
+        try:
+            for c1, c2 in CITY_PAIRS:
+                goal = database["cities"][c2]["coords"]
+                board.find_path(database["cities"][c1]["coords"], eurorails_board, None, lambda p: p == goal,
+                                stats=stats)
+        finally:
+            graph.Frontier = original_frontier
+        return stats["expanded"]
+
+    cases.append(("find_path dijkstra heap", lambda: (graph.Frontier,), dijkstra))
+    cases.append(("find_path dijkstra list", lambda: (ListFrontier,), dijkstra))
+    return cases
+
+
+def mission_all_cases(database, eurorails_board):
+    """
+    `mission <load> <city> all` for MISSION_ALL, as one search per load city and as a single backward search.
+    """
+    cases = []
+    for load, end_city in MISSION_ALL:
+        goal = database["cities"][end_city]["coords"]
+        starts = [database["cities"][c]["coords"] for c in database["loads"][load]]
+
+        def separate(starts, goal):
+            stats = {}
+            for start in starts:
+                board.find_path(start, eurorails_board, None, lambda p: p == goal, stats=stats)
+            return stats["expanded"]
+
+        def backward(starts, goal):
+            stats = {}
+            board.find_paths_to(starts, goal, eurorails_board, None, stats=stats)
+            return stats["expanded"]
+
+        name = "mission " + load + " " + end_city + " all "
+        cases.append((name + "separate", lambda starts=starts, goal=goal: (starts, goal), separate))
+        cases.append((name + "backward", lambda starts=starts, goal=goal: (starts, goal), backward))
+    return cases
+
+
+def connect_cases(database, eurorails_board):
+    """
+    connect_cities over the first 2 to 8 of CONNECT_GROUPS, and with each method over 4, 6 and 8 of them; seeded calls
+    bypass the path cache.
+    """
+    cases = []
+    for n in range(2, len(CONNECT_GROUPS) + 1):
+        cities = [coords(database, g) for g in CONNECT_GROUPS[:n]]
+        def run(cities, method=None):
+            return board.connect_cities(eurorails_board, None, cities, len(cities), method, seed=SEED)[1]
+        cases.append(("connect_cities " + str(n) + " groups", lambda cities=cities: (cities,), run))
+        if n % 2 == 0 and n >= 4:
+            for method in (board.GREEDY, board.EXACT):
+                cases.append(("connect_cities " + method + " " + str(n) + " groups",
+                              lambda cities=cities, method=method: (cities, method), run))
+    return cases
+
+
+def mission_track(database, eurorails_board):
+    """
+    :return: MyTrack holding MISSION_CARDS and a path between the first of CITY_PAIRS.
+    """
+    my_track = MyTrack(eurorails_board, database)
+    for card in MISSION_CARDS:
+        my_track.save_mission_card(*card)
+    c1, c2 = CITY_PAIRS[0]
+    goal = database["cities"][c2]["coords"]
+    path, _ = board.find_path(database["cities"][c1]["coords"], eurorails_board, None, lambda p: p == goal)
+    my_track.add_track(path)
+    return my_track
+
+
+def mission_cases(database, eurorails_board):
+    """
+    compute_optimal_track for one selection and compute_all over every selection of MISSION_CARDS.
+    """
+    from server import RecordingVisual
+
+    my_track = mission_track(database, eurorails_board)
+
+    def setup():
+        PATH_CACHE.clear()
+        return ()
+
+    def optimal():
+        return my_track.compute_optimal_track(1, 2, 3, True)[1]
+
+    def compute_all():
+        costs, _ = my_track.compute_all(True, True, True, RecordingVisual(), (0, 0, 0), "", workers=1)
+        return costs
+
+    return [("compute_optimal_track", setup, optimal), ("compute_all", setup, compute_all)]
+
+
+def track_cases(database, eurorails_board):
+    """
+    Track.copy, union, membership tests and remove_unconnected on the track of a late-game log, and the same copies,
+    unions and membership tests on the reference ListTrack.
+    """
+    log = late_game_log(database, eurorails_board, LOG_PATHS)
+    paths = [path for q in log for _, path in q[1]]
+    track, other = Track(eurorails_board), Track(eurorails_board)
+    list_track, list_other = ListTrack(eurorails_board), ListTrack(eurorails_board)
+    for i, path in enumerate(paths):
+        (track if i % 2 == 0 else other).add_track(path)
+        (list_track if i % 2 == 0 else list_other).add_track(path)
+    points = [(x, y) for x in range(track.min_x, track.max_x + 1) for y in range(track.min_y, track.max_y + 1)]
+
+    def copies(track):
+        for _ in range(100):
+            track.copy()
+        return len(track.adjacency)
+
+    def unions(track, other):
+        copy = track.copy()
+        for _ in range(100):
+            copy.union(other)
+        return len(copy.adjacency)
+
+    def contains(track):
+        return sum(1 for p in points if p in track)
+
+    def isolated():
+        # remove_unconnected drops the points that were added without any edge
+        copy = track.copy()
+        for x, y in [(x, y) for x in range(copy.min_x, copy.max_x + 1, 3) for y in range(copy.min_y, copy.max_y + 1, 3)
+                     if eurorails_board.is_valid(x, y)]:
+            copy.add_point(x, y)
+        return copy, next(track.points())
+
+    def remove(copy, pt):
+        copy.remove_unconnected(pt)
+        return len(copy.adjacency)
+
+    return [("Track.copy x100", lambda: (track,), copies), ("Track.union x100", lambda: (track, other), unions),
+            ("Track contains", lambda: (track,), contains), ("Track.remove_unconnected", isolated, remove),
+            ("ListTrack.copy x100", lambda: (list_track,), copies),
+            ("ListTrack.union x100", lambda: (list_track, list_other), unions),
+            ("ListTrack contains", lambda: (list_track,), contains)]
+
+
+def skipped(names, reason):
+    """
+    :return: cases with the given names that are all skipped for reason.
+    """
+    def skip():
+        raise Skip(reason)
+    return [(name, lambda: (), skip) for name in names]
+
+
+def redraw_cases(database, eurorails_board, image_path):
+    """
+    Visual.redraw of a late-game log: rebuilding the saved layer with the precomputed pixel table, rebuilding it with
+    the pixel coordinates computed for every point drawn, and reusing it when the log has not changed.
+    """
+    names = ["Visual.redraw", "Visual.redraw scan", "Visual.redraw cached"]
+    try:
+        from visual import HeadlessVisual
+        log = late_game_log(database, eurorails_board, LOG_PATHS)
+        visual = HeadlessVisual(image_path, log, eurorails_board)
+        visual.load()
+    except ImportError as error:
+        return skipped(names, str(error))
+    pixels = visual.pixels
+
+    def setup(table, cached):
+        visual.pixels = table
+        if cached:
+            visual.redraw()
+        else:
+            visual.saved_key = None
+        return ()
+
+    def redraw():
+        visual.redraw()
+        visual.pixels = pixels
+        return sum(len(p) for q in log for _, p in q[1])
+
+    return [(names[0], lambda: setup(pixels, False), redraw), (names[1], lambda: setup({}, False), redraw),
+            (names[2], lambda: setup(pixels, True), redraw)]
+
+
+def update_cases(database, eurorails_board, image_path):
+    """
+    Visual.update in a window after a command that drew nothing, after one that drew a path, and when the whole image
+    has to be pushed. Skipped without PIL or a display.
+    """
+    names = ["Visual.update clean", "Visual.update path", "Visual.update full"]
+    try:
+        from visual import Visual
+        visual = Visual(image_path, late_game_log(database, eurorails_board, 1), eurorails_board)
+    except Exception as error: # ImportError without PIL or tkinter, TclError without a display
+        return skipped(names, str(error))
+    path = visual.log.query_log[0][1][0][1]
+
+    def setup(change):
+        change()
+        return ()
+
+    def update():
+        visual.update()
+        return None
+
+    return [(names[0], lambda: setup(lambda: None), update), (names[1], lambda: setup(lambda: visual.draw_path(path)),
+            update), (names[2], lambda: setup(lambda: visual.show(visual.board)), update)]
+
+
+def startup_cases(db_path, board_path, harbor_path):
+    """
+    load_files without a cache, with an empty cache directory (compiling and writing the board cache and city matrix),
+    and with a warm cache.
+    """
+    cache_dir = tempfile.TemporaryDirectory() # removed when the suite exits
+    load_files(db_path, board_path, harbor_path, cache_dir.name)
+    cold_dirs = []
+
+    def cold():
+        cold_dirs.append(tempfile.TemporaryDirectory())
+        return (cold_dirs[-1].name,)
+
+    def run(cache):
+        return len(load_files(db_path, board_path, harbor_path, cache)[1].graph)
+
+    return [("load_files parse", lambda: (None,), run), ("load_files cold", cold, run),
+            ("load_files cached", lambda: (cache_dir.name,), run)]
+
+
+def import_cases(modules=IMPORTED_MODULES):
+    """
+    Importing each module in a fresh interpreter; the result tells whether it loads PIL or tkinter.
+    """
+    def run(module):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], capture_output=True,
+                                text=True)
+        if result.returncode != 0:
+            raise Skip(result.stderr.strip().split("\n")[-1])
+        names = [line.split("|")[-1].strip() for line in result.stderr.split("\n") if line.startswith("import time:")]
+        return [name for name in ("PIL", "tkinter") if name in names]
+
+    return [("import " + module, lambda module=module: (module,), run) for module in modules]
+
+
+def run_suite(opts):
+    """
+    Runs every case whose name contains opts.filter.
+
+    :return: dictionary of results, as written to JSON.
+    """
+    random.seed(SEED)
+    database, eurorails_board = load_files(opts.db_path, opts.board_path, opts.harbor_path)
+    eurorails_board.workers = 1
+    cases = path_cases(database, eurorails_board) + mission_all_cases(database, eurorails_board) + \
+        connect_cases(database, eurorails_board) + mission_cases(database, eurorails_board) + \
+        track_cases(database, eurorails_board) + redraw_cases(database, eurorails_board, opts.image_path) + \
+        update_cases(database, eurorails_board, opts.image_path) + \
+        startup_cases(opts.db_path, opts.board_path, opts.harbor_path) + import_cases()
+
+    results = {}
+    for name, setup, run in cases:
+        if opts.filter is not None and opts.filter not in name:
+            continue
+        try:
+            times, value = time_case(setup, run, opts.repeats)
+        except Skip as reason:
+            results[name] = {"skipped": str(reason)}
+            print(name.ljust(NAME_WIDTH) + "skipped: " + str(reason))
+            continue
+        times.sort()
+        results[name] = {"times_ms": times, "min_ms": times[0], "median_ms": times[len(times) // 2], "result": value}
+        print(name.ljust(NAME_WIDTH) + ("%.2f" % results[name]["median_ms"]).rjust(10) + " ms  result " +
+              str(value)[:40])
+    return {"suite_version": SUITE_VERSION, "seed": SEED, "repeats": opts.repeats, "python": platform.python_version(),
+            "platform": platform.platform(), "board": eurorails_board.version, "results": results}
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the median time of every case in both runs and flags slowdowns beyond threshold and changed results.
+
+    :return: number of regressions and changed results.
+    """
+    problems = 0
+    if baseline.get("board") != current.get("board"):
+        print("warning: the runs used different board files")
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        old = baseline["results"].get(name)
+        new = current["results"].get(name)
+        if old is None or new is None or "skipped" in old or "skipped" in new:
+            if (old is None or "skipped" in old) and (new is None or "skipped" in new):
+                print(name.ljust(NAME_WIDTH) + "skipped")
+            else:
+                print(name.ljust(NAME_WIDTH) + "only in " +
+                      ("current" if old is None or "skipped" in old else "baseline"))
+            continue
+        ratio = new["median_ms"] / old["median_ms"] if old["median_ms"] > 0 else 1.0
+        flags = []
+        if ratio > 1 + threshold:
+            flags.append("SLOWER")
+        elif ratio < 1 - threshold:
+            flags.append("faster")
+        if old["result"] != new["result"]:
+            flags.append("RESULT CHANGED")
+        problems += ("SLOWER" in flags) + ("RESULT CHANGED" in flags)
+        print(name.ljust(NAME_WIDTH) + ("%.2f" % old["median_ms"]).rjust(10) + " ms ->" +
+              ("%.2f" % new["median_ms"]).rjust(10) + " ms  " + ("%.2fx" % ratio).rjust(7) + "  " + " ".join(flags))
+    return problems
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options]\n\nRuns the benchmark suite, or compares it with a saved baseline.")
+    parser.add_option("--database", dest="db_path", default=str(DEFAULT_DB_PATH))
+    parser.add_option("--board", dest="board_path", default=str(DEFAULT_BOARD_PATH))
+    parser.add_option("--harbors", dest="harbor_path", default=str(DEFAULT_HARBOR_PATH))
+    parser.add_option("--image", dest="image_path", default=str(DEFAULT_IMG_PATH))
+    parser.add_option("--repeats", dest="repeats", type="int", default=DEFAULT_REPEATS)
+    parser.add_option("--filter", dest="filter", default=None, help="only run cases whose name contains this text")
+    parser.add_option("--output", dest="output", default=None, help="write the results to this JSON file")
+    parser.add_option("--compare", dest="baseline", default=None,
+                      help="JSON results of a baseline run to compare with")
+    parser.add_option("--input", dest="input", default=None,
+                      help="with --compare, JSON results to compare instead of running the suite")
+    parser.add_option("--threshold", dest="threshold", type="float", default=DEFAULT_THRESHOLD,
+                      help="relative slowdown of the median time reported as a regression")
+    opts, args = parser.parse_args()
+
+    if opts.input is not None:
+        with open(opts.input) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(opts)
+    if opts.output is not None:
+        with open(opts.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if opts.baseline is not None:
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+        print()
+        sys.exit(1 if compare(baseline, current, opts.threshold) > 0 else 0)
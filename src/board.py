@@ -1,16 +1,39 @@
-from random import choice
-from random import sample
-from mytrack import Track
+from random import Random, randrange, sample
+import copy
+import mytrack
+from graph import HexGraph, RANDOM_TIES, DETERMINISTIC_TIES
+from steiner import steiner_tree, INFINITY
+from cache import PATH_CACHE
+from workers import WORKER_POOL, WORKER_STATE
+import time
+from array import array
 
 REG_HARBOR_PENALTY = 12
 HIGH_HARBOR_PENALTY = 10000
 STEP_PENALTY = 0.2
 
+MAX_DIRECT_GOALS = 16
+
+GREEDY = "greedy"
+EXACT = "exact"
+AUTO = "auto"
+EXACT_GROUP_LIMIT = 8 # a three-mission query with owned track; the exact solve takes ~4 s at 8 groups, greedy ~0.7 s
+
+UNOWNED = -1
+SHARED = -2
+
 MAJOR_CITIES = ["madrid", "london", "paris", "berlin", "ruhr", "wien", "holland", "milano"]
 
 def is_one_step(dx, dy):
     return (dx, dy) in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1))
 
+def hex_distance(p1, p2):
+    """
+    Number of steps between two points on the hex grid, ignoring terrain.
+    """
+    dx, dy = p2[0] - p1[0], p2[1] - p1[1]
+    return (abs(dx) + abs(dy) + abs(dx + dy)) // 2
+
 
 class Board:
     def __init__(self, board, harbors, min_x, max_x, min_y, max_y):
@@ -22,6 +45,31 @@ class Board:
         self.harbors = harbors
         self.harbor_penalty = REG_HARBOR_PENALTY
         self.step_penalty = STEP_PENALTY
+        self.graph = None
+        self.cost_grid = None
+        self.version = None
+        self.city_matrix = None
+        self.connect_method = GREEDY
+        self.workers = 1
+
+    def compile(self):
+        """
+        (Re)builds the compact search graph used by find_path.
+        """
+        self.graph = HexGraph(self)
+        return self.graph
+
+    def get_cost_grid(self):
+        """
+        :return: CostGrid of the board, built on first use, or None if NumPy is not installed.
+        """
+        if self.cost_grid is None:
+            try:
+                from costgrid import CostGrid # NumPy is only loaded by the operations that need it
+            except ImportError:
+                return None
+            self.cost_grid = CostGrid(self)
+        return self.cost_grid
 
     def __call__(self, x, y):
         x_index = 2 * (x - self.min_x)
@@ -127,6 +175,35 @@ class Board:
 
             return cost
 
+    def validate_paths(self, paths):
+        """
+        Checks that every point of each path is valid and every step goes to an adjacent point or across a ferry.
+
+        :return: list with True for each valid path.
+        """
+        grid = self.get_cost_grid()
+        if grid is not None:
+            return grid.validate_paths(paths).tolist()
+        result = []
+        for path in paths:
+            valid = all(self.is_valid(x, y) for x, y in path)
+            for p1, p2 in zip(path[:-1], path[1:]):
+                if not is_one_step(p2[0] - p1[0], p2[1] - p1[1]) and \
+                        not (self.is_harbor(p1[0], p1[1]) and self.get_other_harbor(p1[0], p1[1]) == tuple(p2)):
+                    valid = False
+            result.append(valid)
+        return result
+
+    def penalty_per_hex(self):
+        """
+        Lower bound on the search penalty paid per hex of distance covered. A step costs step_penalty for one hex,
+        while a ferry crosses its whole hex distance for one harbor_penalty.
+        """
+        rate = self.step_penalty
+        for h1, (h2, _) in self.harbors.items():
+            rate = min(rate, self.harbor_penalty / hex_distance(h1, h2))
+        return rate
+
     def cycle_harbor_penalty(self):
         if self.harbor_penalty == REG_HARBOR_PENALTY:
             self.harbor_penalty = HIGH_HARBOR_PENALTY
@@ -134,171 +211,383 @@ class Board:
             self.harbor_penalty = REG_HARBOR_PENALTY
 
 
-def find_path(start_city, board, my_track, reached_goal, reverse=True):
+def make_heuristic(board, goals):
+    """
+    Builds an admissible A* heuristic for a set of goals: the hex distance to the nearest goal, priced at the lowest
+    penalty per hex any step or ferry can achieve. Build costs are not counted, since owned track and lakes are free.
+
+    :param goals: a Track, or an iterable of points and Tracks.
+    :return: function mapping a point to a lower bound on its remaining cost, or None if there are no goals or more
+        than MAX_DIRECT_GOALS of them (e.g. an existing track), where computing the bound would cost more than the
+        expansions it saves.
+    """
+    points = set()
+    for g in ([goals] if isinstance(goals, mytrack.Track) else goals):
+        if isinstance(g, mytrack.Track):
+            points.update(g.points())
+        else:
+            points.add(tuple(g))
+    if len(points) == 0 or len(points) > MAX_DIRECT_GOALS:
+        return None
+    rate = board.penalty_per_hex()
+    return lambda pt: rate * min(hex_distance(pt, g) for g in points)
+
+
+def find_path(start_city, board, my_track, reached_goal, reverse=True, ties=RANDOM_TIES, goals=None, stats=None,
+              rng=None):
     """
     Finds path from end city to some goal (e.g. start city, load, existing track).
+
+    :param ties: RANDOM_TIES to break ties between equal-cost points at random, DETERMINISTIC_TIES to expand them
+        in the order they were reached.
+    :param goals: points and/or Tracks that satisfy reached_goal. If given and there are at most MAX_DIRECT_GOALS
+        points, runs an A* search towards them instead of expanding blindly.
+    :param stats: optional dictionary; "expanded" is incremented by the number of points expanded.
+    :param rng: optional random.Random used for random ties.
+    """
+    graph = board.graph if board.graph is not None else board.compile()
+    starts = start_city if type(start_city) == set or type(start_city) == list else [start_city]
+    sources = []
+    for sc in starts:
+        if sc not in graph.ids:
+            raise ValueError("Point " + str(sc) + " is not a valid point on the board")
+        sources.append(graph.ids[sc])
+
+    heuristic = None
+    h = make_heuristic(board, goals) if goals is not None else None
+    if h is not None:
+        heuristic = lambda v: h(graph.coords[v])
+
+    end, settled = graph.search(sources, graph.owned_mask(my_track), board.step_penalty, board.harbor_penalty,
+                                lambda v: reached_goal(graph.coords[v]), heuristic, ties, stats, rng=rng)
+    if end is None:
+        print("No path found")
+        return None, None
+
+    path = graph.path(settled, end)
+    if not reverse:
+        path.reverse()
+    return path, settled[end][2]
+
+
+def query_key(kind, board, my_track, *terminals):
     """
+    :return: key for PATH_CACHE describing a query on the current board, owned track and harbor penalty.
+    """
+    fingerprint = my_track.fingerprint() if my_track is not None and my_track.has_track else None
+    return (kind, terminals, fingerprint, board.harbor_penalty, board.step_penalty, board.version)
+
 
-    def get_path(point, reverse):
-        path = []
-        while point.parent is not None:
-            path.append(point.coord)
-            point = point.parent
-        path.append(point.coord)
-        if reverse:
-            return list(reversed(path))
+def find_path_to(start_city, end_points, board, my_track):
+    """
+    Cached find_path (A*) from start_city (a point or list of points) to the nearest of end_points.
+    """
+    starts = tuple(start_city) if type(start_city) == set or type(start_city) == list else (start_city,)
+    key = query_key("path", board, my_track, starts, tuple(end_points))
+    result = PATH_CACHE.get(key)
+    if result is None:
+        ends = set(end_points)
+        result = find_path(list(starts), board, my_track, lambda p: p in ends, goals=ends)
+        if result[0] is not None:
+            PATH_CACHE.put(key, result)
+    return list(result[0]) if result[0] is not None else None, result[1]
+
+
+def find_paths_to(start_cities, end_city, board, my_track, ties=RANDOM_TIES, stats=None):
+    """
+    Finds the best path from each of several start points to one end point, with a single backward search from the
+    end point that stops once every start point is settled. Results are cached unless stats are requested.
+
+    :return: list of (path, cost) tuples in the order of start_cities; (None, None) where no path exists.
+    """
+    key = query_key("paths to", board, my_track, tuple(start_cities), end_city, ties)
+    if stats is None:
+        results = PATH_CACHE.get(key)
+        if results is not None:
+            return [(list(p) if p is not None else None, c) for p, c in results]
+
+    graph = board.graph if board.graph is not None else board.compile()
+    for pt in list(start_cities) + [end_city]:
+        if pt not in graph.ids:
+            raise ValueError("Point " + str(pt) + " is not a valid point on the board")
+
+    remaining = set(graph.ids[sc] for sc in start_cities)
+    def reached_all(v):
+        remaining.discard(v)
+        return len(remaining) == 0
+
+    _, settled = graph.search([graph.ids[end_city]], graph.owned_mask(my_track), board.step_penalty,
+                              board.harbor_penalty, reached_all, ties=ties, stats=stats, backward=True)
+    results = []
+    for sc in start_cities:
+        v = graph.ids[sc]
+        if v in settled:
+            results.append((graph.path(settled, v, backward=True), settled[v][2]))
         else:
-            return path
-
-    def get_neighbors(point):
-        neighbors = []
-        for dx, dy in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)):
-            if board.is_valid(point.x + dx, point.y + dy):
-                if not board.is_harbor(point.x, point.y) or \
-                        board.is_harbor(point.x, point.y) and not board.is_harbor(point.x + dx, point.y + dy):
-                    c = board.compute_cost(point.coord, (point.x + dx, point.y + dy), my_track)
-                    neighbors.append(Point((point.x + dx, point.y + dy), point, point.build_cost + c, point.penalty + board.step_penalty))
-        if board.is_harbor(point.x, point.y):
-            neighbors.append(Point(board.get_other_harbor(point.x, point.y), point, point.build_cost, point.penalty + board.harbor_penalty))
-
-        return neighbors
-
-    class LinkedList:
-        def __init__(self, obj=None):
-            self.item = obj
-            self.next = self
-            self.prev = self
-
-        def append(self, obj):
-            if self.item is None:
-                self.item = obj
-            else:
-                new_item = LinkedList(obj)
-                new_item.prev = self.prev
-                new_item.next = self
+            results.append((None, None))
+    PATH_CACHE.put(key, [(list(p) if p is not None else None, c) for p, c in results])
+    return results
 
-                self.prev.next = new_item
-                self.prev = new_item
 
-        def insert(self, obj):
-            if self.item is None:
-                self.item = obj
-            else:
-                new_item = LinkedList(obj)
-                new_item.prev = self
-                new_item.next = self.next
-
-                self.next.prev = new_item
-                self.next = new_item
-
-        def pop(self):
-            item = self.item
-            if self.prev == self and self.next == self:
-                self.item = None
-
-            self.prev.next = self.next
-            self.next.prev = self.prev
-            return item
-
-        def pop_min(self, value=lambda x: x):
-            min_nodes = []
-            for node in self:
-                if min_nodes == [] or value(min_nodes[0].item) == value(node.item):
-                    min_nodes.append(node)
-                elif value(min_nodes[0].item) > value(node.item):
-                    min_nodes = [node]
-            min_node = choice(min_nodes)
-            if min_node is self:
-                new_first_node = min_node.next
-            else:
-                new_first_node = self
-            return min_node.pop(), new_first_node
-
-        def size(self):
-            return len([node for node in self])
-
-        def __str__(self):
-            return str(self.item)
-
-        # def __eq__(self, other):
-        #     return self.item == other.item
-
-        def __iter__(self):
-            if self.item is not None:
-                yield self
-            node = self.next
-            while node is not self:
-                if node.item is not None:
-                    yield node
-                node = node.next
-
-    class Point:
-        def __init__(self, point, parent=None, cost=0, penalty=0):
-            self.x, self.y = point
-            self.parent = parent
-            self.build_cost = cost
-            self.penalty = penalty
-
-        @property
-        def coord(self):
-            return (self.x, self.y)
-
-        def get_cost(self):
-            return self.build_cost + self.penalty
-
-        def __str__(self):
-            return "(" + str(self.x) + ", " + str(self.y) + ")"
-
-        def __hash__(self):
-            return hash((self.x, self.y))
-
-        def __eq__(self, other):
-            return other is not None and self.x == other.x and self.y == other.y
-
-    agenda = LinkedList()
-    if type(start_city) == set or type(start_city) == list:
-        for ec in start_city:
-            # agenda.append(Point(ec, cost=board.compute_point_cost(ec, my_track)))
-            agenda.append(Point(ec, cost=0))
+def connect_from_matrix(matrix, harbor_penalty, group_1, group_2):
+    """
+    Answers connect_cities for two groups of cities on an empty board from the precomputed city matrix, trying each
+    group as the home group like the search does.
+    """
+    s1, e1 = matrix.nearest(group_1, group_2, harbor_penalty)
+    s2, e2 = matrix.nearest(group_2, group_1, harbor_penalty)
+    if matrix.cost(s1, e1, harbor_penalty) <= matrix.cost(s2, e2, harbor_penalty):
+        return [matrix.path(s1, e1, harbor_penalty)], matrix.cost(s1, e1, harbor_penalty)
     else:
-        # agenda.append(Point(start_city, cost=board.compute_point_cost(start_city, my_track)))
-        agenda.append(Point(start_city, cost=0))
-    visited = set()
-    while agenda.size() > 0:
-        current_point, agenda = agenda.pop_min(value=Point.get_cost)
-        if current_point not in visited:
-            visited.add(current_point)
-            if reached_goal((current_point.x, current_point.y)):
-                return get_path(current_point, reverse), current_point.build_cost
+        return [matrix.path(s2, e2, harbor_penalty)], matrix.cost(s2, e2, harbor_penalty)
+
+
+def connect_exact(board, my_track, cities, memo=None):
+    """
+    Connects every group of cities (and my_track, if it has track) with an exact minimum Steiner tree.
+    """
+    graph = board.graph if board.graph is not None else board.compile()
+    owned = graph.owned_mask(my_track)
+    groups = []
+    if my_track is not None and my_track.has_track:
+        groups.append([v for v in range(len(graph)) if owned[v]])
+    for group in cities:
+        for c in group:
+            if c not in graph.ids:
+                raise ValueError("Point " + str(c) + " is not a valid point on the board")
+        groups.append([graph.ids[c] for c in group])
+
+    paths, cost = steiner_tree(graph, groups, owned, board.step_penalty, board.harbor_penalty, memo)
+    if paths is None:
+        print("No path found")
+        return None, None
+    return [[graph.coords[v] for v in p] for p in paths], cost
+
+
+class OwnerLabels:
+    """
+    Labels every node of the board graph with the index of the track that owns it, so that the greedy
+    connect_cities method can tell which track a point belongs to with one array lookup.
+
+    Nodes owned by no track are labelled UNOWNED. The few nodes owned by several tracks (e.g. a city that is both a
+    destination and a load source) are labelled SHARED, and their owners are kept in a dictionary instead.
+    """
+    def __init__(self, graph, tracks):
+        self.ids = graph.ids
+        self.labels = array("i", [UNOWNED] * len(graph))
+        self.members = {}
+        self.shared = {}
+        for i, t in enumerate(tracks):
+            self.members[i] = []
+            for p in t.points():
+                v = self.ids.get(p)
+                if v is None:
+                    continue
+                label = self.labels[v]
+                if label == UNOWNED:
+                    self.labels[v] = i
+                elif label == SHARED:
+                    self.shared[v].add(i)
+                elif label != i:
+                    self.labels[v] = SHARED
+                    self.shared[v] = {label, i}
+                self.members[i].append(v)
+
+    def owners(self, point):
+        """
+        :return: collection of the labels of the tracks that own point.
+        """
+        label = self.labels[self.ids[point]]
+        if label == SHARED:
+            return self.shared[self.ids[point]]
+        return () if label == UNOWNED else (label,)
+
+    def owned_by_other(self, point, label):
+        """
+        :return: True if point belongs to a track other than the one labelled label.
+        """
+        owner = self.labels[self.ids[point]]
+        if owner == SHARED:
+            return any(o != label for o in self.shared[self.ids[point]])
+        return owner != UNOWNED and owner != label
+
+    def merge(self, label, other):
+        """
+        Merges the tracks labelled label and other by relabelling the nodes of the smaller one.
+
+        :return: label of the merged track
+        """
+        if len(self.members[label]) < len(self.members[other]):
+            label, other = other, label
+        for v in self.members[other]:
+            if self.labels[v] == SHARED:
+                owners = self.shared[v]
+                owners.discard(other)
+                owners.add(label)
+                if len(owners) == 1:
+                    del self.shared[v]
+                    self.labels[v] = label
             else:
-                neighbors = get_neighbors(current_point)
-                for n in neighbors:
-                    if n not in visited:
-                        # if reached_goal((n.x, n.y)) and not reverse:
-                        #     c = board.compute_point_cost((n.x, n.y), my_track)
-                        #     n.build_cost -= c # correction for path calculation from end city to beginning city
-                        agenda.append(n)
+                self.labels[v] = label
+        self.members[label].extend(self.members.pop(other))
+        return label
 
-    print("No path found")
-    return None, None
-    # TODO: implement A* search
 
+def greedy_step(board, home, owners, others, rng, memo):
+    """
+    One step of greedy_restart through memo: searches the whole field from the home track, or reuses the field of an
+    earlier search from the same track, and returns the path to the cheapest point of the other tracks.
 
-def connect_cities(board, my_track, cities, number_tries=1):
-    def contained(tracks):
-        def __contained(point):
-            for t in tracks:
-                if point in t:
-                    return True
-            return False
+    :param others: labels of the tracks not merged into home yet.
+    :return: tuple (path, build cost), or (None, None) if no other track can be reached.
+    """
+    graph = board.graph
+    owned = graph.owned_mask(home)
+    sources = frozenset(graph.ids[r] for r in home.representatives)
+    context = (bytes(owned), board.step_penalty, board.harbor_penalty)
+    field = memo.get(context, ("greedy", sources))
+    if field is None:
+        _, settled = graph.search(list(sources), owned, board.step_penalty, board.harbor_penalty, rng=rng)
+        priorities = [INFINITY] * len(graph)
+        builds = [0] * len(graph)
+        parents = [-1] * len(graph)
+        for v, (_, parent, build, penalty) in settled.items():
+            priorities[v] = build + penalty
+            builds[v] = build
+            parents[v] = parent if parent is not None else -1
+        field = memo.put_field(context, ("greedy", sources), priorities, builds, parents)
+    priorities, builds, parents = field
+
+    # the search would stop at the first point of another track it settles, i.e. the one of lowest priority
+    candidates = [v for label in others for v in owners.members[label]]
+    end = min(candidates, key=lambda v: (priorities[v], v))
+    if priorities[end] == INFINITY:
+        print("No path found")
+        return None, None
+    path = []
+    v = end
+    while v >= 0:
+        path.append(graph.coords[v])
+        v = parents[v]
+    path.reverse()
+    return path, builds[end]
+
+
+def greedy_restart(board, tracks, home_index, seed, memo=None):
+    """
+    One restart of the greedy connect_cities method: starting from tracks[home_index], repeatedly builds to the
+    nearest remaining track and merges it in. The tracks are copied, not modified.
 
-        return __contained
+    :param seed: seed for the random tie-breaking of this restart.
+    :param memo: optional SearchMemo; the search of each step is kept in it and reused by later steps, restarts and
+        calls that start from the same track.
+    :return: tuple (list of paths, total build cost)
+    """
+    graph = board.graph if board.graph is not None else board.compile()
+    rng = Random(seed)
+    tracks_cp = {i: t.copy() for i, t in enumerate(tracks)}
+    owners = OwnerLabels(graph, tracks)
+    home = tracks_cp.pop(home_index)
+    home_label = home_index
+    all_paths = []
+    total_cost = 0
+
+    while len(tracks_cp) > 0:
+        if memo is not None:
+            p, c = greedy_step(board, home, owners, list(tracks_cp), rng, memo)
+        else:
+            p, c = find_path(home.representatives, board, home,
+                             reached_goal=lambda pt: owners.owned_by_other(pt, home_label), reverse=True, rng=rng)
+        home.add_track(p)
+        for label in [o for o in owners.owners(p[-1]) if o != home_label]:
+            home.union(tracks_cp.pop(label))
+            home_label = owners.merge(home_label, label)
+        home.remove_unconnected(p[0])
+        all_paths.append(p)
+        total_cost += c
+
+    return all_paths, total_cost
+
+
+def run_restart(tracks, harbor_penalty, home_index, seed):
+    board = WORKER_STATE["board"]
+    board.harbor_penalty = harbor_penalty
+    for t in tracks:
+        t.orig_board = board
+    return greedy_restart(board, tracks, home_index, seed)
+
+def detach_tracks(tracks):
+    """
+    :return: copies of tracks without their board and database, which pool workers already hold.
+    """
+    detached = []
+    for t in tracks:
+        t = copy.copy(t)
+        t.orig_board = None
+        if isinstance(t, mytrack.MyTrack):
+            t.database = None
+        detached.append(t)
+    return detached
+
+
+def connect_cities(board, my_track, cities, number_tries=1, method=None, stats=None, workers=None, seed=None,
+                   memo=None):
+    """
+    Connects groups of cities to each other and to my_track, where one city of each group has to be reached.
+
+    :param number_tries: number of home groups the greedy method starts from.
+    :param method: GREEDY to join the nearest group repeatedly, EXACT for a minimum Steiner tree, or AUTO to solve
+        exactly up to EXACT_GROUP_LIMIT groups (counting my_track). Defaults to board.connect_method.
+    :param stats: optional dictionary; receives the method used and the solve time in seconds.
+    :param workers: number of processes for the greedy restarts; defaults to board.workers, 1 runs them serially.
+    :param seed: base seed for the restarts, restart i uses seed + i; the home groups are also drawn from it. Drawn
+        from random if None.
+    :param memo: optional SearchMemo shared with other calls of the same command; holds the exact method's tables
+        and, when the restarts run serially, the greedy method's search fields.
+    :return: tuple (list of paths, total build cost); unseeded results are cached in PATH_CACHE.
+    """
+    # answer repeated queries from the cache; seeded and measured calls always search
+    key = None
+    if stats is None and seed is None:
+        key = query_key("connect", board, my_track, tuple(tuple(g) for g in cities), number_tries,
+                        method if method is not None else board.connect_method)
+        result = PATH_CACHE.get(key)
+        if result is not None:
+            return [list(p) for p in result[0]], result[1]
+    opt_paths, opt_cost = connect_uncached(board, my_track, cities, number_tries, method, stats, workers, seed, memo)
+    if key is not None and opt_paths is not None:
+        PATH_CACHE.put(key, ([list(p) for p in opt_paths], opt_cost))
+    return opt_paths, opt_cost
+
+
+def connect_uncached(board, my_track, cities, number_tries, method, stats, workers, seed, memo):
+    matrix = board.city_matrix
+    if (my_track is None or not my_track.has_track) and len(cities) == 2 and matrix is not None and \
+            matrix.has(board.harbor_penalty) and all(c in matrix for group in cities for c in group):
+        return connect_from_matrix(matrix, board.harbor_penalty, cities[0], cities[1])
+
+    if method is None:
+        method = board.connect_method
+    if method == AUTO:
+        number_groups = len(cities) + (1 if my_track is not None and my_track.has_track else 0)
+        method = EXACT if number_groups <= EXACT_GROUP_LIMIT else GREEDY
+    start_time = time.perf_counter()
+    if stats is not None:
+        stats["method"] = method
+
+    if method == EXACT:
+        opt_paths, opt_cost = connect_exact(board, my_track, cities, memo)
+        if stats is not None:
+            stats["time"] = time.perf_counter() - start_time
+        return opt_paths, opt_cost
+    elif method != GREEDY:
+        raise ValueError("Unknown connection method " + str(method) + ".")
 
     tracks = []
     if my_track is not None and my_track.has_track:
         tracks.append(my_track)
     for group in cities:
-        t = Track(board)
+        t = mytrack.Track(board)
         for c in group:
             t.add_representative(c[0], c[1])
         tracks.append(t)
@@ -306,30 +595,28 @@ def connect_cities(board, my_track, cities, number_tries=1):
     opt_paths = None
     opt_cost = None
     actual_number_tries = number_tries if number_tries <= len(tracks) else len(tracks)
-    order = sample(range(len(tracks)), actual_number_tries)
-    for i in range(actual_number_tries):
-        tracks_cp = [t.copy() for t in tracks]
-        home = tracks_cp.pop(order[i])
-        all_paths = []
-        total_cost = 0
-
-        while len(tracks_cp) > 0:
-            p, c = find_path(home.representatives, board, home, reached_goal=contained(tracks_cp), reverse=True)
-            home.add_track(p)
-            i = 0
-            while i < len(tracks_cp):
-                t = tracks_cp[i]
-                if p[-1] in t:
-                    home.union(t)
-                    tracks_cp.pop(i)
-                else:
-                    i += 1
-            home.remove_unconnected(p[0])
-            all_paths.append(p)
-            total_cost += c
+    if seed is None:
+        order = sample(range(len(tracks)), actual_number_tries)
+        seed = randrange(2 ** 31)
+    else: # seeded calls choose their home groups from the seed too, so they don't depend on the global state
+        order = Random(seed).sample(range(len(tracks)), actual_number_tries)
+    seeds = [seed + i for i in range(actual_number_tries)]
+    if workers is None:
+        workers = board.workers
+
+    if workers > 1 and actual_number_tries > 1:
+        executor = WORKER_POOL.get(workers, board)
+        sent = detach_tracks(tracks)
+        results = list(executor.map(run_restart, [sent] * actual_number_tries,
+                                    [board.harbor_penalty] * actual_number_tries, order, seeds))
+    else:
+        results = [greedy_restart(board, tracks, order[i], seeds[i], memo) for i in range(actual_number_tries)]
 
+    for all_paths, total_cost in results:
         if opt_cost is None or opt_cost > total_cost:
             opt_paths = all_paths
             opt_cost = total_cost
 
+    if stats is not None:
+        stats["time"] = time.perf_counter() - start_time
     return opt_paths, opt_cost
\ No newline at end of file
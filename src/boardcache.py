@@ -0,0 +1,107 @@
+import os
+import json
+import mmap
+import struct
+from array import array
+from board import Board
+from graph import HexGraph
+
+CACHE_VERSION = 1
+CACHE_PREFIX = "board_"
+MAGIC = b"APEB"
+PREAMBLE = struct.Struct("<4sII") # magic, version, header length
+ALIGNMENT = 8
+GRAPH_ARRAYS = ("offsets", "targets", "costs", "river", "harbor", "reverse")
+
+
+def write_board_cache(filename, key, database, board):
+    """
+    Writes the parsed database and board, with its compiled graph, to one binary file.
+
+    The file starts with a JSON header holding the database, board bounds and harbor table, followed by 8-byte
+    aligned sections: the map characters, the length of each map row, the coordinates of every graph node and the
+    arrays of the HexGraph. The header records the offset (from the first aligned position after the header), length
+    and type of each section, so that the file can be mapped into memory and the sections read without parsing.
+
+    :param key: hash of the source files the board was parsed from.
+    """
+    graph = board.graph if board.graph is not None else board.compile()
+    sections = {
+        "grid": array("B", "".join("".join(row) for row in board.board).encode("ascii")),
+        "rows": array("i", [len(row) for row in board.board]),
+        "coords": array("i", [c for point in graph.coords for c in point]),
+    }
+    for name in GRAPH_ARRAYS:
+        sections[name] = getattr(graph, name)
+
+    header = {
+        "key": key,
+        "bounds": [board.min_x, board.max_x, board.min_y, board.max_y],
+        "harbors": [[h[0], h[1], other[0], other[1], cost] for h, (other, cost) in board.harbors.items()],
+        "database": {k: v for k, v in database.items() if k != "points"},
+        "points": [[p[0], p[1], city] for p, city in database["points"].items()],
+        "sections": {},
+    }
+    position = 0
+    for name, data in sections.items():
+        header["sections"][name] = [position, len(data), data.typecode]
+        position = aligned(position + len(data) * data.itemsize)
+    encoded = json.dumps(header).encode("utf-8")
+    base = aligned(PREAMBLE.size + len(encoded))
+
+    with open(filename + ".tmp", "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, CACHE_VERSION, len(encoded)))
+        f.write(encoded)
+        for name, data in sections.items():
+            f.write(b"\0" * (base + header["sections"][name][0] - f.tell()))
+            f.write(data.tobytes())
+    os.replace(filename + ".tmp", filename)
+
+
+def read_board_cache(filename, key):
+    """
+    :return: tuple (database, board) read from a file written by write_board_cache(), or None if the file is missing,
+        from another version or for other source files.
+    """
+    try:
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, header_length = PREAMBLE.unpack_from(data)
+                if magic != MAGIC or version != CACHE_VERSION:
+                    return None
+                header = json.loads(data[PREAMBLE.size:PREAMBLE.size + header_length].decode("utf-8"))
+                if header["key"] != key:
+                    return None
+                base = aligned(PREAMBLE.size + header_length)
+                sections = {}
+                for name, (offset, length, typecode) in header["sections"].items():
+                    sections[name] = array(typecode)
+                    sections[name].frombytes(data[base + offset:base + offset + length * sections[name].itemsize])
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+    database = header["database"]
+    database["points"] = {}
+    for city in database["cities"]:
+        database["cities"][city]["coords"] = tuple(database["cities"][city]["coords"])
+    for x, y, city in header["points"]:
+        database["points"][(x, y)] = city
+
+    grid = sections["grid"].tobytes().decode("ascii")
+    rows = []
+    start = 0
+    for length in sections["rows"]:
+        rows.append(list(grid[start:start + length]))
+        start += length
+    harbors = {(x, y): ((other_x, other_y), cost) for x, y, other_x, other_y, cost in header["harbors"]}
+    min_x, max_x, min_y, max_y = header["bounds"]
+    board = Board(rows, harbors, min_x, max_x, min_y, max_y)
+
+    coords = sections["coords"]
+    board.graph = HexGraph.from_arrays([(coords[i], coords[i + 1]) for i in range(0, len(coords), 2)],
+                                       *[sections[name] for name in GRAPH_ARRAYS])
+    return database, board
+
+
+def aligned(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache for path query results.
+    """
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.journal = None # list of the gets and puts since start of recording, or None
+
+    def get(self, key):
+        """
+        :return: cached value for key, or None if it is not cached.
+        """
+        value = None
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            value = self.entries[key]
+        else:
+            self.misses += 1
+        if self.journal is not None:
+            self.journal.append(("get", key, value))
+        return value
+
+    def put(self, key, value):
+        if self.journal is not None:
+            self.journal.append(("put", key, value))
+        if self.size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def resize(self, size):
+        self.size = size
+        while len(self.entries) > max(size, 0):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def isolate(self):
+        """
+        Starts an empty cache, for work that must not see or change the current entries.
+
+        :return: the previous entries, for restore().
+        """
+        entries = self.entries
+        self.entries = OrderedDict()
+        return entries
+
+    def restore(self, entries):
+        self.entries = entries
+
+    def replay(self, journal):
+        """
+        Repeats the gets and puts another process recorded in journal, if every get finds the same value here.
+
+        :return: True if the journal was replayed; False if a get would have found something else, in which case the
+            cache is left as it was.
+        """
+        entries, hits, misses = self.entries, self.hits, self.misses
+        self.entries = OrderedDict(entries)
+        for action, key, value in journal:
+            if action == "put":
+                self.put(key, value)
+            elif self.get(key) != value:
+                self.entries, self.hits, self.misses = entries, hits, misses
+                return False
+        return True
+
+    def report(self):
+        return "Path cache: " + str(len(self.entries)) + "/" + str(self.size) + " entries, " + str(self.hits) + \
+               " hits, " + str(self.misses) + " misses"
+
+
+PATH_CACHE = LRUCache()
@@ -0,0 +1,101 @@
+import os
+import pickle
+from array import array
+from graph import DETERMINISTIC_TIES
+
+CACHE_VERSION = 1
+CACHE_PREFIX = "city_matrix_"
+
+
+class CityMatrix:
+    """
+    Shortest build paths between every pair of cities on an empty board, for each harbor penalty setting.
+
+    For each penalty and start city, the matrix keeps the build cost and search priority (build cost plus penalties)
+    of reaching every other city, and the parent of every node in the shortest-path tree, so that paths can be
+    rebuilt without searching again. Cities are identified by their coordinates.
+    """
+    def __init__(self, database, board, harbor_penalties):
+        graph = board.graph if board.graph is not None else board.compile()
+        self.settings = (board.step_penalty, tuple(harbor_penalties))
+        self.coords = graph.coords
+        self.ids = graph.ids
+        self.cities = [database["cities"][city]["coords"] for city in database["cities"]]
+        self.costs = {}
+        self.priorities = {}
+        self.parents = {}
+        empty = bytearray(len(graph))
+        for harbor_penalty in harbor_penalties:
+            costs = self.costs[harbor_penalty] = {}
+            priorities = self.priorities[harbor_penalty] = {}
+            parents = self.parents[harbor_penalty] = {}
+            for city in self.cities:
+                _, settled = graph.search([graph.ids[city]], empty, board.step_penalty, harbor_penalty,
+                                          ties=DETERMINISTIC_TIES)
+                costs[city] = {}
+                priorities[city] = {}
+                for other in self.cities:
+                    _, _, build, penalty = settled[graph.ids[other]]
+                    costs[city][other] = build
+                    priorities[city][other] = build + penalty
+                tree = array("i", [-1] * len(graph))
+                for node, (_, parent, _, _) in settled.items():
+                    if parent is not None:
+                        tree[node] = parent
+                parents[city] = tree
+
+    def __contains__(self, pt):
+        return pt in self.costs[self.settings[1][0]]
+
+    def has(self, harbor_penalty):
+        return harbor_penalty in self.costs
+
+    def cost(self, start, end, harbor_penalty):
+        return self.costs[harbor_penalty][start][end]
+
+    def path(self, start, end, harbor_penalty):
+        """
+        :return: list of points from city start to city end.
+        """
+        tree = self.parents[harbor_penalty][start]
+        node = self.ids[end]
+        path = []
+        while node != -1:
+            path.append(self.coords[node])
+            node = tree[node]
+        path.reverse()
+        return path
+
+    def nearest(self, starts, ends, harbor_penalty):
+        """
+        Finds the pair of cities a search from starts towards ends would settle on first.
+
+        :return: tuple (start, end)
+        """
+        priorities = self.priorities[harbor_penalty]
+        return min(((s, e) for s in starts for e in ends), key=lambda pair: priorities[pair[0]][pair[1]])
+
+
+def load_city_matrix(database, board, harbor_penalties, cache_path, key):
+    """
+    Loads the city matrix from cache_path, or computes and caches it if no cache entry matches the key.
+
+    :param key: hash of the source files the matrix is derived from.
+    :return: CityMatrix object
+    """
+    filename = os.path.join(cache_path, CACHE_PREFIX + key + ".pickle")
+    if os.path.exists(filename):
+        try:
+            with open(filename, "rb") as f:
+                version, matrix = pickle.load(f)
+            if version == CACHE_VERSION and matrix.settings == (board.step_penalty, tuple(harbor_penalties)):
+                return matrix
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            pass
+
+    matrix = CityMatrix(database, board, harbor_penalties)
+    os.makedirs(cache_path, exist_ok=True)
+    with open(filename + ".tmp", "wb") as f:
+        pickle.dump((CACHE_VERSION, matrix), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + ".tmp", filename)
+    return matrix
@@ -0,0 +1,73 @@
+import numpy as np
+
+TERRAIN_CODES = {".": 1, "L": 2, "m": 3, "a": 4, "S": 5, "M": 6, "h": 7, "H": 8} # 0 for invalid points
+
+
+class CostGrid:
+    """
+    NumPy arrays describing the terrain of a Board, for checking many drawn paths at once.
+
+    Point (x, y) is at row max_y - y and column x - min_x of every array. terrain holds the TERRAIN_CODES code of each
+    point (0 where invalid) and ferries the (row, column) of both ends of every ferry, once from each side.
+    """
+    def __init__(self, board):
+        self.min_x = board.min_x
+        self.max_y = board.max_y
+        rows = (len(board.board) + 1) // 2
+        cols = (len(board.board[0]) + 1) // 2
+
+        # map characters on a grid padded with spaces to whole rows and columns of points
+        chars = np.full((2 * rows, 2 * cols), ord(" "), dtype=np.uint8)
+        for r, row in enumerate(board.board):
+            line = np.frombuffer("".join(row[:2 * cols]).encode("ascii"), dtype=np.uint8)
+            chars[r, :len(line)] = line
+
+        codes = np.zeros(256, dtype=np.int8)
+        for c, code in TERRAIN_CODES.items():
+            codes[ord(c)] = code
+        self.terrain = codes[chars[0::2, 0::2]]
+        self.valid = self.terrain != 0
+
+        ferries = [self.index(pt) + self.index(other) for pt, (other, _) in board.harbors.items()]
+        self.ferries = np.array(ferries, dtype=np.int64).reshape(-1, 4)
+
+    @property
+    def shape(self):
+        return self.terrain.shape
+
+    def index(self, pt):
+        """
+        :return: (row, column) of point pt in the arrays.
+        """
+        return self.max_y - pt[1], pt[0] - self.min_x
+
+    def validate_paths(self, paths):
+        """
+        Checks many paths at once: every point must be valid, and every step must go to an adjacent point or across a
+        ferry.
+
+        :return: boolean array with one entry per path.
+        """
+        result = np.ones(len(paths), dtype=bool)
+        points = [(i, p[0], p[1]) for i, path in enumerate(paths) for p in path]
+        if len(points) == 0:
+            return result
+        owner, x, y = (np.array(a, dtype=np.int64) for a in zip(*points))
+        rows, cols = self.max_y - y, x - self.min_x
+        inside = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+        valid = inside.copy()
+        valid[inside] = self.valid[rows[inside], cols[inside]]
+        result[owner[~valid]] = False
+
+        # steps are pairs of consecutive points of the same path
+        step = owner[1:] == owner[:-1]
+        dx, dy = (x[1:] - x[:-1])[step], (y[1:] - y[:-1])[step]
+        adjacent = (abs(dx) <= 1) & (abs(dy) <= 1) & (dx != dy)
+        cols_count = self.shape[1]
+        starts = rows[:-1][step] * cols_count + cols[:-1][step]
+        ends = rows[1:][step] * cols_count + cols[1:][step]
+        ferry_keys = (self.ferries[:, 0] * cols_count + self.ferries[:, 1]) * self.terrain.size + \
+            self.ferries[:, 2] * cols_count + self.ferries[:, 3]
+        ferry = np.isin(starts * self.terrain.size + ends, ferry_keys)
+        result[owner[1:][step][~(adjacent | ferry)]] = False
+        return result
@@ -0,0 +1,224 @@
+import heapq
+from array import array
+from random import random
+
+RANDOM_TIES = "random"
+DETERMINISTIC_TIES = "deterministic"
+
+DIRECTIONS = ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1))
+TERRAIN_COSTS = {".": 1, "L": 1, "m": 2, "a": 5, "S": 3, "M": 3}
+HARBOR_COST = 3
+
+
+class Frontier:
+    """
+    Heap-based agenda for path searches.
+
+    Each key (a board point) keeps only its best priority: push() ignores entries that do not improve on it, so a
+    cheaper route acts as a decrease-key, and entries it supersedes are dropped lazily when they reach the top.
+    """
+    def __init__(self, ties=RANDOM_TIES, rng=None):
+        if ties != RANDOM_TIES and ties != DETERMINISTIC_TIES:
+            raise ValueError("Unknown tie-breaking mode " + str(ties) + ".")
+        self.ties = ties
+        self.random = rng.random if rng is not None else random
+        self.heap = []
+        self.best = {}
+        self.done = set()
+        self.counter = 0
+
+    def push(self, key, item, priority):
+        if key in self.done:
+            return False
+        best = self.best.get(key)
+        if best is not None:
+            # random ties keep equal-priority alternatives so that either parent can win, like choice(min_nodes)
+            if priority > best or (priority == best and self.ties == DETERMINISTIC_TIES):
+                return False
+        self.best[key] = priority
+        self.counter += 1
+        tie = self.random() if self.ties == RANDOM_TIES else self.counter
+        heapq.heappush(self.heap, (priority, tie, self.counter, key, item))
+        return True
+
+    def pop(self):
+        """
+        Removes and returns the item with the lowest priority, or None once every key has been popped.
+        """
+        while self.heap:
+            _, _, _, key, item = heapq.heappop(self.heap)
+            if key not in self.done:
+                self.done.add(key)
+                return item
+        return None
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class HexGraph:
+    """
+    Compact adjacency structure for a Board, compiled once so that searches do not re-read the ASCII map.
+
+    Valid points are numbered 0..n-1. The neighbours of node u are targets[offsets[u]:offsets[u + 1]] (CSR layout),
+    and for each of these edges costs[e] is the cost of building into the target without any owned track, river[e]
+    the river/inlet crossing alone, and reverse[e] the index of the same edge in the opposite direction. harbor[u]
+    is the node on the other side of u's ferry, or -1.
+    """
+    def __init__(self, board):
+        self.coords = []
+        self.ids = {}
+        for x in range(board.min_x, board.max_x + 1):
+            for y in range(board.min_y, board.max_y + 1):
+                if board.is_valid(x, y):
+                    self.ids[(x, y)] = len(self.coords)
+                    self.coords.append((x, y))
+
+        self.offsets = array("i", [0])
+        self.targets = array("i")
+        self.costs = array("i")
+        self.river = array("i")
+        self.harbor = array("i", [-1] * len(self.coords))
+        for u, (x, y) in enumerate(self.coords):
+            terrain = board(x, y)
+            for dx, dy in DIRECTIONS:
+                v = self.ids.get((x + dx, y + dy))
+                if v is None:
+                    continue
+                dest = board(x + dx, y + dy)
+                if board.is_harbor(x, y) and board.is_harbor(x + dx, y + dy):
+                    continue
+                crossing = board.board[2 * (board.max_y - y) - dy][2 * (x - board.min_x) + dx]
+                crossing = 0 if crossing == " " else int(crossing)
+                self.targets.append(v)
+                self.river.append(crossing)
+                if terrain == "L" and dest == "L":
+                    self.costs.append(0)
+                else:
+                    self.costs.append(self.point_cost(board, x + dx, y + dy) + crossing)
+            self.offsets.append(len(self.targets))
+            if board.is_harbor(x, y):
+                self.harbor[u] = self.ids[board.get_other_harbor(x, y)]
+
+        # the adjacency is symmetric, so every edge has a twin pointing back
+        self.reverse = array("i", [-1] * len(self.targets))
+        for u in range(len(self.coords)):
+            for e in range(self.offsets[u], self.offsets[u + 1]):
+                v = self.targets[e]
+                for r in range(self.offsets[v], self.offsets[v + 1]):
+                    if self.targets[r] == u:
+                        self.reverse[e] = r
+
+    @staticmethod
+    def from_arrays(coords, offsets, targets, costs, river, harbor, reverse):
+        """
+        Rebuilds a HexGraph from the arrays of a compiled one, e.g. read back from a board cache.
+        """
+        graph = HexGraph.__new__(HexGraph)
+        graph.coords = coords
+        graph.ids = {c: v for v, c in enumerate(coords)}
+        graph.offsets, graph.targets, graph.costs, graph.river, graph.harbor, graph.reverse = \
+            offsets, targets, costs, river, harbor, reverse
+        return graph
+
+    @staticmethod
+    def point_cost(board, x, y):
+        dest = board(x, y)
+        if dest in TERRAIN_COSTS:
+            return TERRAIN_COSTS[dest]
+        elif dest == "h":
+            other_harbor, cost = board.harbors[(x, y)]
+            if board(other_harbor[0], other_harbor[1]) == "H":
+                cost += HARBOR_COST
+            return cost
+        elif dest == "H":
+            _, cost = board.harbors[(x, y)]
+            return cost + HARBOR_COST
+        else:
+            raise ValueError("Board contains invalid character.")
+
+    def __len__(self):
+        return len(self.coords)
+
+    def owned_mask(self, track):
+        """
+        :return: bytearray with a 1 for every node that belongs to track.
+        """
+        mask = bytearray(len(self.coords))
+        if track is not None:
+            for c in track.points():
+                v = self.ids.get(c)
+                if v is not None:
+                    mask[v] = 1
+        return mask
+
+    def search(self, sources, owned, step_penalty, harbor_penalty, reached_goal=None, heuristic=None,
+               ties=RANDOM_TIES, stats=None, backward=False, rng=None):
+        """
+        Best-first search from a set of source nodes (Dijkstra, or A* when a heuristic is given).
+
+        Building into an owned node is free apart from its river crossing, and moving along owned track is free.
+        A backward search follows edges against their direction, so the build cost of a settled node is the cost of
+        building from it to the nearest source, and its parent is the next point on that route.
+
+        :param owned: bytearray from owned_mask().
+        :param reached_goal: predicate on node ids; if None, the search settles every reachable node.
+        :param heuristic: optional admissible lower bound on the remaining cost of a node.
+        :param rng: optional random.Random used to break ties; defaults to the random module.
+        :return: tuple (goal node or None, dictionary mapping each settled node to (node, parent, build, penalty)).
+        """
+        offsets, targets, costs, river, harbor = self.offsets, self.targets, self.costs, self.river, self.harbor
+        reverse = self.reverse
+        agenda = Frontier(ties, rng)
+        settled = {}
+        for s in sources:
+            agenda.push(s, (s, None, 0, 0), heuristic(s) if heuristic is not None else 0)
+        while True:
+            item = agenda.pop()
+            if item is None:
+                break
+            u, _, build, penalty = item
+            settled[u] = item
+            if stats is not None:
+                stats["expanded"] = stats.get("expanded", 0) + 1
+            if reached_goal is not None and reached_goal(u):
+                return u, settled
+
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                if v in settled:
+                    continue
+                if backward:
+                    if owned[u]:
+                        cost = build if owned[v] else build + river[e]
+                    else:
+                        cost = build + costs[reverse[e]]
+                elif owned[v]:
+                    cost = build if owned[u] else build + river[e]
+                else:
+                    cost = build + costs[e]
+                step = penalty + step_penalty
+                priority = cost + step
+                if heuristic is not None:
+                    priority += heuristic(v)
+                agenda.push(v, (v, u, cost, step), priority)
+            v = harbor[u]
+            if v >= 0 and v not in settled:
+                ferry = penalty + harbor_penalty
+                priority = build + ferry
+                if heuristic is not None:
+                    priority += heuristic(v)
+                agenda.push(v, (v, u, build, ferry), priority)
+        return None, settled
+
+    def path(self, settled, node, backward=False):
+        """
+        :return: list of points from the search source to node, or from node to the source for a backward search.
+        """
+        path = []
+        while node is not None:
+            path.append(self.coords[node])
+            node = settled[node][1]
+        if not backward:
+            path.reverse()
+        return path
@@ -1,14 +1,28 @@
 class Log:
     def __init__(self, database):
         self.query_log = []
+        self.snapshots = [] # track snapshot after each entry of query_log, or None
+        self.version = 0 # changes whenever entries are recorded or removed
         self.current_query = 0
         self.database = database
 
     def record(self, action, location):
+        self.version += 1
         if len(self.query_log) > 0 and self.query_log[-1][0] == self.current_query:
             self.query_log[-1][1].append([action, location])
         else:
-            self.query_log.append([self.current_query, [[action, location]]])    
+            self.query_log.append([self.current_query, [[action, location]]])
+            self.snapshots.append(None)
+
+    def save_snapshot(self, snapshot):
+        """
+        Attaches a Track snapshot of the state after the last entry, so that undo can restore it without replaying.
+        """
+        if len(self.snapshots) > 0:
+            self.snapshots[-1] = snapshot
+
+    def last_snapshot(self):
+        return self.snapshots[-1] if len(self.snapshots) > 0 else None
     
     def step(self):
         self.current_query += 1
@@ -42,8 +56,12 @@ class Log:
             if only_last_query:
                 if self.query_log[-1][0] == self.current_query - 1:
                     self.query_log.pop()
+                    self.snapshots.pop()
+                    self.version += 1
             else:
                 self.query_log.pop()
+                self.snapshots.pop()
+                self.version += 1
         else:
             raise IndexError("pop from empty log.")
     
@@ -52,6 +70,8 @@ class Log:
     
     def clean(self):
         self.query_log = []
+        self.snapshots = []
+        self.version += 1
     
     def __iter__(self):
         for query in self.query_log:
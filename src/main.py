@@ -1,8 +1,11 @@
 from utils import *
 from mytrack import *
-from visual import *
 from board import *
 from log import *
+from memo import SearchMemo
+from cache import PATH_CACHE, DEFAULT_CACHE_SIZE
+from batch import BatchRunner, take_batch
+from workers import WORKER_POOL
 from collections import deque
 from optparse import OptionParser
 import random
@@ -12,6 +15,7 @@ DEFAULT_BOARD_PATH = "../database/board_ascii.txt"
 DEFAULT_IMG_PATH = "../database/board.jpg"
 DEFAULT_HARBOR_PATH = "../database/harbors.txt"
 DEFAULT_RESULTS_PATH = "../results/"
+DEFAULT_CACHE_PATH = "../database/cache/"
 INDENT_1 = "    "
 INDENT_2 = INDENT_1 + "  "
 
@@ -53,6 +57,12 @@ def print_path(path, cost, start_city=None):
     else:
         return "Optimal Cost Path: " + start_city + ", cost " + str(cost) + ", length " + str(len(path)) + "\n" + INDENT_1
 
+def random_color():
+    """
+    :return: color for the drawings of a query, drawn from the random module.
+    """
+    return random.randrange(0, 150), random.randrange(0, 150), random.randrange(0, 150)
+
 def clear_extra(my_track, log, visual):
     """
     Clear extra tracks which don't belong to my_track from visual.
@@ -62,8 +72,7 @@ def clear_extra(my_track, log, visual):
     :param visual: Visual object containing the GUI
     :return: None   TODO: return True if successful
     """
-    my_track.clean() # clears track and empties queue
-    my_track.add_from_log(log) # takes each saved action from log and adds it to my_track
+    my_track.restore_from_log(log) # clears queue and restores track saved with the last log entry
     visual.redraw() # redraw visual
 
 def undo(my_track, log, visual):
@@ -75,12 +84,18 @@ def undo(my_track, log, visual):
     :param visual: Visual object containing the GUI
     :return: None   TODO: return True if successful
     """
-    my_track.clean()
     log.pop() # undo last action in log
-    my_track.add_from_log(log)  # takes each saved action from log and adds it to my_track
+    my_track.restore_from_log(log) # restores track saved with the new last log entry
     visual.redraw()
 
-def handle_query(database, board, my_track, log, visual, results_path, query):
+def record_result(result, **fields):
+    """
+    Adds fields (e.g. costs) to the structured result of a query, if the caller asked for one.
+    """
+    if result is not None:
+        result.update(fields)
+
+def handle_query(database, board, my_track, log, visual, results_path, query, result=None):
     """
     Query handler for program.
     
@@ -90,13 +105,14 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
     :param log: Log object containing a history of all saved actions.
     :param visual: Visual object containing the GUI.
     :param query: string containing the user's query. Unprocessed when passed to query handler. See README API for keywords.
+    :param result: optional dictionary that receives the costs (and rewards) computed by the query.
     :return: string containing console output of query.
     """
     tokenized = query.split(' ')
     keyword = tokenized[0]
     tokenized = tokenized[1:] # remove keyword from tokenized
     output = ""
-    color = (random.randrange(0, 150), random.randrange(0, 150), random.randrange(0, 150))
+    color = random_color()
     save = len(keyword) > 0 and keyword[-1] == "*" # check if save character is at the end of the keyword
     if save:
         keyword = keyword[:-1]
@@ -131,6 +147,10 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
         elif sec_keyword == "missions":
             output += my_track.print_current_mission_cards()
 
+        # QUERY = print cache
+        elif sec_keyword == "cache":
+            output += PATH_CACHE.report() + "\n" + INDENT_1
+
     # QUERY = city
     elif keyword == "city":
         for city in tokenized:
@@ -164,6 +184,7 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                 my_track.append_to_queue(p)
                 visual.draw_path(p, color)
             output += "Total cost: " + str(cost) + "\n" + INDENT_1
+            record_result(result, cost=cost)
     
         # QUERY = destination city and load
         elif keyword == "mission" and len(tokenized) >= 2:
@@ -181,10 +202,19 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                 visual.mark_city(end_city_loc, color)
                 output += print_city(database, end_city)
         
+                # without owned track, paths between cities come straight from the precomputed matrix
+                matrix = board.city_matrix
+                use_matrix = not my_track.has_track and matrix is not None and matrix.has(board.harbor_penalty)
+
                 if mode == "best": # find best path from load to city
                     load_city_locs = [database["cities"][sc]["coords"] for sc in start_cities]
                     
-                    path, cost = find_path(load_city_locs, board, my_track, lambda p: p == end_city_loc)
+                    if use_matrix:
+                        start_loc, _ = matrix.nearest(load_city_locs, [end_city_loc], board.harbor_penalty)
+                        path = matrix.path(start_loc, end_city_loc, board.harbor_penalty)
+                        cost = matrix.cost(start_loc, end_city_loc, board.harbor_penalty)
+                    else:
+                        path, cost = find_path_to(load_city_locs, [end_city_loc], board, my_track)
                     my_track.append_to_queue(path)
                     best_load_city = database["points"][path[0]]
         
@@ -193,6 +223,7 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                     
                     output += print_path(path, cost, best_load_city)
                     visual.draw_path(path, color)
+                    record_result(result, cost=cost)
                 
                 elif mode == "all": # default option -> mode == "all"; find all paths from load to city
                     # output all cities first before paths
@@ -200,13 +231,18 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                         visual.mark_city(database["cities"][sc]["coords"], color)
                         output += print_city(database, sc)
     
-                    for sc in start_cities:
-                        start_city_loc = database["cities"][sc]["coords"]
-                        
-                        path, cost = find_path(start_city_loc, board, my_track, lambda p: p == end_city_loc)
+                    start_city_locs = [database["cities"][sc]["coords"] for sc in start_cities]
+                    if use_matrix:
+                        routes = [(matrix.path(scl, end_city_loc, board.harbor_penalty),
+                                   matrix.cost(scl, end_city_loc, board.harbor_penalty)) for scl in start_city_locs]
+                    else: # one search back from the end city settles every load city
+                        routes = find_paths_to(start_city_locs, end_city_loc, board, my_track)
+
+                    for sc, (path, cost) in zip(start_cities, routes):
                         my_track.append_to_queue(path)
                         output += print_path(path, cost, sc)
                         visual.draw_path(path, color)
+                    record_result(result, costs=[cost for _, cost in routes])
         
         elif keyword == "add" and len(tokenized) >= 2:
             sec_keyword = tokenized[0]
@@ -245,6 +281,7 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                     my_track.append_to_queue(p)
                     visual.draw_path(p, color)
                 output += "Total cost: " + str(cost) + "\n" + INDENT_1
+                record_result(result, cost=cost)
 
             # QUERY = connect load and destination city to existing track
             if sec_keyword == "mission":
@@ -270,6 +307,7 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                     my_track.append_to_queue(p)
                     visual.draw_path(p, color)
                 output += "Total cost: " + str(cost) + "\n" + INDENT_1
+                record_result(result, cost=cost)
 
             # QUERY = add a new mission card
             elif sec_keyword == "card":
@@ -297,11 +335,14 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                     choose_mission_2 = True
                     choose_mission_3 = True
 
-                costs, rewards = my_track.compute_all(choose_mission_1, choose_mission_2, choose_mission_3, log,
-                                                      visual, color, results_path)
+                memo = SearchMemo()
+                costs, rewards = my_track.compute_all(choose_mission_1, choose_mission_2, choose_mission_3, visual,
+                                                      color, results_path, memo=memo)
                 for i in range(len(costs)):
                     output += "Cost " + str(i + 1) + ":   " + str(costs[i]) + "\n      "
                     output += "Reward " + str(i + 1) + ": " + str(rewards[i]) + "\n    "
+                output += memo.report() + "\n    "
+                record_result(result, costs=costs, rewards=rewards)
 
             else: # choose specific missions from each card
                 select_1 = int(tokenized[0]) if tokenized[0] != '0' else None
@@ -318,6 +359,7 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                     my_track.append_to_queue(p)
                 output += "Total Cost: " + str(cost) + "\n" + INDENT_1
                 output += "Reward: " + str(reward) + "\n" + INDENT_1
+                record_result(result, cost=cost, reward=reward)
 
         # QUERY = draw a custom path
         elif keyword == "draw":
@@ -342,6 +384,8 @@ def handle_query(database, board, my_track, log, visual, results_path, query):
                         path.append((path[-1][0] + 1, path[-1][1] - 1))
                 else:
                     raise ValueError("point argument not understood.")
+            if not board.validate_paths([path])[0]:
+                raise ValueError("path contains invalid points or steps between points that are not adjacent.")
             visual.draw_path(path, color)
             my_track.append_to_queue(path)
         
@@ -378,17 +422,52 @@ if __name__ == '__main__':
     parser.add_option("--image", dest="image_path", default=str(DEFAULT_IMG_PATH))
     parser.add_option("--harbors", dest="harbor_path", default=str(DEFAULT_HARBOR_PATH))
     parser.add_option("--results", dest="results_path", default=str(DEFAULT_RESULTS_PATH))
+    parser.add_option("--cache", dest="cache_path", default=str(DEFAULT_CACHE_PATH))
+    parser.add_option("--connect", dest="connect_method", default=GREEDY, choices=[GREEDY, EXACT, AUTO],
+                      help="how to connect groups of cities: greedy (default), exact, or auto (exact up to " +
+                      str(EXACT_GROUP_LIMIT) + " groups)")
+    parser.add_option("--workers", dest="workers", type="int", default=1,
+                      help="number of worker processes for path computations")
+    parser.add_option("--path-cache-size", dest="path_cache_size", type="int", default=DEFAULT_CACHE_SIZE,
+                      help="number of path query results to keep, 0 to disable")
+    parser.add_option("--headless", dest="headless", action="store_true", default=False,
+                      help="run without a window; the map is only rendered into saved images")
+    parser.add_option("--serve", dest="serve", action="store_true", default=False,
+                      help="answer JSON-RPC queries on a local socket instead of reading them from the console")
+    parser.add_option("--socket", dest="socket_path", default=None,
+                      help="Unix socket for --serve; by default it listens on a local TCP port")
+    parser.add_option("--port", dest="port", type="int", default=8765, help="TCP port for --serve")
     opts, args = parser.parse_args()
 
-    database, board = load_files(opts.db_path, opts.board_path, opts.harbor_path)
+    database, board = load_files(opts.db_path, opts.board_path, opts.harbor_path, opts.cache_path)
+    board.connect_method = opts.connect_method
+    board.workers = opts.workers
+    PATH_CACHE.resize(opts.path_cache_size)
+    if opts.serve:
+        from server import run_server
+        run_server(database, board, opts.results_path, opts.socket_path, opts.port, opts.workers)
+        exit()
     log = Log(database)
-    visual = Visual(opts.image_path, log)
+    if opts.headless:
+        from visual import HeadlessVisual
+        visual = HeadlessVisual(opts.image_path, log, board)
+    else:
+        from visual import Visual
+        visual = Visual(opts.image_path, log, board)
     my_track = MyTrack(board, database)
     results_path = opts.results_path
+    batch = BatchRunner(database, board, results_path, opts.workers)
 
     queue = deque()
     i = 1
     while True:
+        # run queries loaded from files in batches, searching independent ones in parallel
+        if len(queue) > 0:
+            queries = take_batch(queue)
+            if len(queries) > 0:
+                i = batch.run(database, board, my_track, log, visual, queries, i)
+                continue
+
         # update log and visual
         log.step()
         visual.update()
@@ -402,9 +481,13 @@ if __name__ == '__main__':
 
         # reload database files
         if raw_expression == "reload":
-            database, board = load_files(opts.db_path, opts.board_path, opts.harbor_path)
+            database, board = load_files(opts.db_path, opts.board_path, opts.harbor_path, opts.cache_path)
+            board.connect_method = opts.connect_method
+            board.workers = opts.workers
+            PATH_CACHE.clear()
             log.update_database(database)
             my_track.update_database(database)
+            batch = BatchRunner(database, board, results_path, opts.workers)
 
         # load queries from specified file
         elif raw_expression[:4] == "file":
@@ -416,6 +499,7 @@ if __name__ == '__main__':
         # exit out of program
         elif raw_expression == "e" or raw_expression == "exit":
             visual.quit()
+            WORKER_POOL.shutdown()
             break
         
         else: # handle query
@@ -0,0 +1,63 @@
+from array import array
+
+
+class SearchMemo:
+    """
+    Cache of search results shared by the searches of one command, such as the selections of compute_all.
+
+    The Dreyfus-Wagner table for a set of terminal groups only depends on those groups, the owned track and the
+    penalties, so it is keyed on exactly that. Tables for single groups are the distance fields from each group, and
+    tables for pairs hold the group-to-group connection costs; selections that share a destination city, a load or
+    the major cities reuse them instead of searching again. The greedy method keeps the field searched from its home
+    track at each step the same way, keyed on the home track and the penalties, and reads the connection to the
+    nearest other group off it.
+    """
+    def __init__(self):
+        self.tables = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def get(self, context, groups):
+        """
+        :param context: hashable description of the owned track and penalties, see steiner_tree().
+        :param groups: frozenset of group keys.
+        :return: tuple (costs, parents) of arrays indexed by node id, or None if not cached.
+        """
+        entry = self.tables.get((context, groups))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, context, groups, costs, parents):
+        entry = (array("d", costs), array("i", parents))
+        self.tables[(context, groups)] = entry
+        self.bytes += sum(a.itemsize * len(a) for a in entry)
+        return entry
+
+    def put_field(self, context, key, priorities, builds, parents):
+        """
+        Stores the search field of a greedy connect_cities step: the priority, build cost and parent of every node
+        reached from the home track.
+        """
+        entry = (array("d", priorities), array("i", builds), array("i", parents))
+        self.tables[(context, key)] = entry
+        self.bytes += sum(a.itemsize * len(a) for a in entry)
+        return entry
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.tables), "bytes": self.bytes}
+
+    def absorb(self, stats):
+        """
+        Adds the counters of a memo used in another process (e.g. a compute_all worker).
+        """
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+        self.bytes += stats["bytes"]
+
+    def report(self):
+        return "Memo: " + str(self.hits) + " hits, " + str(self.misses) + " misses, " + \
+               str(round(self.bytes / 1024)) + " KiB"
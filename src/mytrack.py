@@ -1,7 +1,30 @@
 import board
+import itertools
+from memo import SearchMemo
+from workers import WORKER_POOL, WORKER_STATE
 
 NUMBER_TRIES = 7
 
+COMPUTE_CALLS = itertools.count()
+
+def run_compute(track, selection, call):
+    """
+    Solves one selection of MyTrack.compute_all in a pool worker, on a snapshot of the owned track without its board
+    and database. The worker keeps one SearchMemo per compute_all call, shared by the selections it solves.
+
+    :param call: number of the compute_all call the selection belongs to.
+    :return: tuple (paths, cost, reward, memo counters added by this selection)
+    """
+    if WORKER_STATE.get("call") != call:
+        WORKER_STATE["call"] = call
+        WORKER_STATE["memo"] = SearchMemo()
+    memo = WORKER_STATE["memo"]
+    track.orig_board, track.database = WORKER_STATE["board"], WORKER_STATE["database"]
+    before = memo.stats()
+    p, c, r = track.compute_optimal_track(*selection, True, memo=memo)
+    after = memo.stats()
+    return p, c, r, {key: after[key] - before[key] for key in after}
+
 class Mission: # takes a the attributes of one mission and puts it in an object
     def __init__(self, load, dest_city, reward):
         self.load = load
@@ -43,16 +66,72 @@ class MissionCard: # takes a list of lists describing up to 3 mission cards
         return output
 
 class Track:
+    """
+    Owned track on the board, stored as a bit per cell of a grid twice the size of the board in each direction:
+    points sit on even rows and columns (like Board), and the cells between them mark owned edges.
+
+    Alongside the grid, adjacency maps every owned point to the set of points it has owned edges to, so that
+    connectivity questions cost time proportional to the track rather than to the board.
+
+    The grid and adjacency are copy-on-write: copy(), snapshot() and restore() share them, and the first change
+    afterwards (see unshare()) gives the track its own copy.
+    """
     def __init__(self, board):
         self.min_x = board.min_x
         self.max_x = board.max_x
         self.min_y = board.min_y
         self.max_y = board.max_y
         self.orig_board = board
-        self.board = [[0 for _ in range(2 * (abs(self.min_x) + abs(self.max_x) + 1))] for _ in
-                      range(2 * (abs(self.min_y) + abs(self.max_y) + 1))]
+        self.width = 2 * (abs(self.min_x) + abs(self.max_x) + 1)
+        self.height = 2 * (abs(self.min_y) + abs(self.max_y) + 1)
+        self.bits = bytearray((self.width * self.height + 7) // 8)
         self.has_track = False
         self.representatives = set()
+        self.adjacency = {}
+        self.shared = False
+
+    def unshare(self):
+        """
+        Copies the grid and adjacency if they are shared with a copy or snapshot; called before every change.
+        """
+        if self.shared:
+            self.bits = bytearray(self.bits)
+            self.adjacency = {p: neighbours.copy() for p, neighbours in self.adjacency.items()}
+            self.shared = False
+
+    def snapshot(self):
+        """
+        :return: immutable record of the track's current state, for restore().
+        """
+        self.shared = True
+        return self.bits, self.adjacency, frozenset(self.representatives), self.has_track
+
+    def restore(self, snapshot):
+        self.bits, self.adjacency, representatives, self.has_track = snapshot
+        self.representatives = set(representatives)
+        self.shared = True
+
+    def cell(self, x_index, y_index):
+        """
+        :return: bit index of a grid cell, or None if the cell is off the grid.
+        """
+        if 0 <= x_index < self.width and 0 <= y_index < self.height:
+            return y_index * self.width + x_index
+        return None
+
+    def read_cell(self, x_index, y_index):
+        i = self.cell(x_index, y_index)
+        if i is not None:
+            return self.bits[i >> 3] >> (i & 7) & 1
+        return None
+
+    def write_cell(self, x_index, y_index, value):
+        i = self.cell(x_index, y_index)
+        if i is not None:
+            if value:
+                self.bits[i >> 3] |= 1 << (i & 7)
+            else:
+                self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xff
 
     def add_representative(self, x, y):
         self.representatives.add((x, y))
@@ -65,31 +144,29 @@ class Track:
         self.representatives = {(x, y)}
     
     def add_point(self, x, y):
-        x_index = 2 * (x - self.min_x)
-        y_index = 2 * (self.max_y - y)
-        if 0 <= x_index < len(self.board[0]) and 0 <= y_index < len(self.board):
-            self.board[y_index][x_index] = 1
+        self.unshare()
+        if self.cell(2 * (x - self.min_x), 2 * (self.max_y - y)) is not None:
+            self.write_cell(2 * (x - self.min_x), 2 * (self.max_y - y), 1)
+            self.adjacency.setdefault((x, y), set())
 
         if not self.has_track and (x,y) not in self.representatives:
             self.set_representative(x, y)
         self.has_track = True
 
     def remove_point(self, x, y):
-        x_index = 2 * (x - self.min_x)
-        y_index = 2 * (self.max_y - y)
-        if 0 <= x_index < len(self.board[0]) and 0 <= y_index < len(self.board):
-            self.board[y_index][x_index] = 0
+        """
+        Removes a point and the owned edges that end in it.
+        """
+        self.unshare()
+        self.write_cell(2 * (x - self.min_x), 2 * (self.max_y - y), 0)
+        for nx, ny in self.adjacency.pop((x, y), ()):
+            self.write_cell(2 * (x - self.min_x) + nx - x, 2 * (self.max_y - y) - (ny - y), 0)
+            self.adjacency[(nx, ny)].discard((x, y))
         if (x, y) in self.representatives:
             self.representatives.remove((x, y))
         # TODO: check if track is now empty
 
     def add_track(self, sequence):
-        def claim_track(self, x, y, dx, dy):
-            x_index = 2 * (x - self.min_x) + dx
-            y_index = 2 * (self.max_y - y) - dy
-            if 0 <= x_index < len(self.board[0]) and 0 <= y_index < len(self.board):
-                self.board[y_index][x_index] = 1
-
         for i in range(len(sequence)):
             x, y = sequence[i]
             self.add_point(x, y)
@@ -97,69 +174,113 @@ class Track:
                 dx = sequence[i + 1][0] - x
                 dy = sequence[i + 1][1] - y
                 if board.is_one_step(dx, dy):
-                    claim_track(self, x, y, dx, dy)
+                    self.add_edge(x, y, dx, dy)
+
+    def add_edge(self, x, y, dx, dy):
+        self.unshare()
+        if (x, y) in self.adjacency and self.cell(2 * (x + dx - self.min_x), 2 * (self.max_y - y - dy)) is not None:
+            self.write_cell(2 * (x - self.min_x) + dx, 2 * (self.max_y - y) - dy, 1)
+            self.adjacency[(x, y)].add((x + dx, y + dy))
+            self.adjacency.setdefault((x + dx, y + dy), set()).add((x, y))
+
+    def degree(self, x, y):
+        """
+        :return: number of owned edges at point (x, y), or None if the point is not owned.
+        """
+        neighbours = self.adjacency.get((x, y))
+        return len(neighbours) if neighbours is not None else None
+
+    def components(self):
+        """
+        Splits the owned points into groups connected by owned edges.
+
+        :return: list of sets of points
+        """
+        components = []
+        seen = set()
+        for start in self.adjacency:
+            if start in seen:
+                continue
+            seen.add(start)
+            component = {start}
+            stack = [start]
+            while stack:
+                for n in self.adjacency[stack.pop()]:
+                    if n not in seen:
+                        seen.add(n)
+                        component.add(n)
+                        stack.append(n)
+            components.append(component)
+        return components
 
     def __contains__(self, pt):
         if len(pt) == 2:
             x_index = 2 * (pt[0] - self.min_x)
             y_index = 2 * (self.max_y - pt[1])
-            if 0 <= x_index < len(self.board[0]) and 0 <= y_index < len(self.board):
-                return self.board[y_index][x_index]
         elif len(pt) == 4:
             x_index = 2 * (pt[0] - self.min_x) + pt[2]
             y_index = 2 * (self.max_y - pt[1]) - pt[3]
-            if 0 <= x_index < len(self.board[0]) and 0 <= y_index < len(self.board):
-                return self.board[y_index][x_index]
         else:
             return False
+        if 0 <= x_index < self.width and 0 <= y_index < self.height:
+            i = y_index * self.width + x_index
+            return self.bits[i >> 3] >> (i & 7) & 1
+        return None
+
+    def points(self):
+        """
+        Yields the owned points in order of x, then y.
+        """
+        for p in sorted(self.adjacency):
+            yield p
 
     def clean(self):
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                self.board[r][c] = 0
+        self.bits = bytearray(len(self.bits))
         self.has_track = False
         self.representatives = set()
+        self.adjacency = {}
+        self.shared = False
 
     def remove_unconnected(self, pt):
+        """
+        Makes pt the only representative and removes every other point that has no owned edge.
+        """
         self.set_representative(pt[0], pt[1])
-        for x in range(self.min_x, self.max_x + 1):
-            for y in range(self.min_y, self.max_y + 1):
-                if (x != pt[0] or y != pt[1]) and (x, y) in self:
-                    connected = False
-                    for dx, dy in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)):
-                        if (x, y, dx, dy) in self:
-                            connected = True
-                    if not connected:
-                        self.remove_point(x, y)
+        for x, y in [p for p, neighbours in self.adjacency.items() if not neighbours and p != tuple(pt)]:
+            self.remove_point(x, y)
 
     def __iter__(self):
-        for x in range(self.min_x, self.max_x + 1):
-            for y in range(self.min_y, self.max_y + 1):
-                for dx, dy in ((1, 0), (0, -1), (1, -1)):
-                    if (x, y, dx, dy) in self:
-                        yield [(x, y), (x + dx, y + dy)]
+        """
+        Yields every owned edge once as [(x, y), (x + dx, y + dy)], in the order of points().
+        """
+        for x, y in self.points():
+            neighbours = self.adjacency[(x, y)]
+            for dx, dy in ((1, 0), (0, -1), (1, -1)):
+                if (x + dx, y + dy) in neighbours:
+                    yield [(x, y), (x + dx, y + dy)]
 
     def __str__(self):
-        output = ""
-        for x in range(self.min_x, self.max_x + 1):
-            for y in range(self.min_y, self.max_y + 1):
-                if (x, y) in self:
-                    output += "(" + str(x) + ", " + str(y) + ") "
-        return output
+        return "".join("(" + str(x) + ", " + str(y) + ") " for x, y in self.points())
+
+    def fingerprint(self):
+        """
+        :return: hashable summary of the owned points, edges and representatives, equal for equal tracks.
+        """
+        return hash((bytes(self.bits), frozenset(self.representatives)))
 
     def copy(self):
         copy = Track(self.orig_board)
-        copy.board = [[self.board[r][c] for c in range(len(self.board[r]))] for r in range(len(self.board))]
-        copy.representatives = self.representatives.copy()
+        copy.restore(self.snapshot())
         return copy
     
     def union(self, other):
-        if len(self.board) != len(other.board) or len(self.board[0]) != len(other.board[0]):
+        if self.width != other.width or self.height != other.height:
             raise Exception("union called on boards with different dimensions.")
-        for r in range(len(other.board)):
-            for c in range(len(other.board[r])):
-                if other.board[r][c] == 1:
-                    self.board[r][c] = 1
+        self.unshare()
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+        for p, neighbours in other.adjacency.items():
+            self.adjacency.setdefault(p, set()).update(neighbours)
 
 class MyTrack(Track):
     def __init__(self, board, database):
@@ -185,8 +306,7 @@ class MyTrack(Track):
     
     def copy(self):
         copy = MyTrack(self.orig_board, self.database)
-        copy.board = [[self.board[r][c] for c in range(len(self.board[r]))] for r in range(len(self.board))]
-        copy.representatives = self.representatives.copy()
+        copy.restore(self.snapshot())
         copy.database = self.database
         copy.queued_track = []
         copy.mission_cards = [None, None, None]
@@ -198,6 +318,18 @@ class MyTrack(Track):
                 if action == "path":
                     self.add_track(location)
 
+    def restore_from_log(self, log):
+        """
+        Resets the owned track to its state after the last query in log, from the snapshot saved with that query, or
+        by replaying the whole log if it has none.
+        """
+        self.clean()
+        snapshot = log.last_snapshot()
+        if snapshot is not None:
+            self.restore(snapshot)
+        else:
+            self.add_from_log(log)
+
     ###############
     # QUEUE LOGIC #
     ###############
@@ -209,6 +341,8 @@ class MyTrack(Track):
             self.add_track(path)
             if add_to_log and log is not None:
                 log.record("path", path)
+        if add_to_log and log is not None and len(self.queued_track) > 0:
+            log.save_snapshot(self.snapshot())
         self.empty_queued_track()
 
     def empty_queued_track(self):
@@ -260,7 +394,8 @@ class MyTrack(Track):
         else:
             raise ValueError("Index for mission cards out of bounds.")
 
-    def compute_optimal_track(self, mission_select_1=None, mission_select_2=None, mission_select_3=None, require_major_city=False):
+    def compute_optimal_track(self, mission_select_1=None, mission_select_2=None, mission_select_3=None, require_major_city=False,
+                              memo=None):
         cities = []
         loads = []
         reward = 0
@@ -288,10 +423,19 @@ class MyTrack(Track):
                 major_cities = [self.database["cities"][mc]["coords"] for mc in board.MAJOR_CITIES]
                 all_cities.append(major_cities)
 
-        all_paths, cost = board.connect_cities(self.orig_board, self, all_cities, NUMBER_TRIES)
+        all_paths, cost = board.connect_cities(self.orig_board, self, all_cities, NUMBER_TRIES, memo=memo)
         return all_paths, cost, reward
 
-    def compute_all(self, mission_1, mission_2, mission_3, log, visual, color, filepath):
+    def compute_all(self, mission_1, mission_2, mission_3, visual, color, filepath, workers=None, memo=None):
+        """
+        Computes the optimal track for every selection of missions on the chosen cards and saves an image of each.
+
+        :param memo: optional SearchMemo; selections share exact sub-solutions through it. Worker processes keep their
+            own memo and report their counters back into this one.
+        :return: tuple (list of costs, list of rewards)
+        """
+        if memo is None:
+            memo = SearchMemo()
         mission_cards = []
         if mission_1:
             if self.has_mission_card(1):
@@ -318,23 +462,40 @@ class MyTrack(Track):
         else:
             mission_3_options = [0]
 
-        costs = []
-        rewards = []
-
+        selections = []
         for choice_1 in mission_1_options:
             for choice_2 in mission_2_options:
                 for choice_3 in mission_3_options:
-                    name_append = str(choice_1) + str(choice_2) + str(choice_3)
-                    p, c, r = self.compute_optimal_track(choice_1 if choice_1 != 0 else None,
-                                                         choice_2 if choice_2 != 0 else None,
-                                                         choice_3 if choice_3 != 0 else None, True) # polymerase chain reaction
-                    visual.save(filepath + "missions_" + name_append + ".png", p, color)
-                    costs.append(c)
-                    rewards.append(r)
-                    self.clean()
-                    self.queue_from_log(log)
-                    self.save_queued_track(log, False)
-                    visual.redraw()
+                    selections.append((choice_1, choice_2, choice_3))
+
+        # every selection is solved against the same snapshot, so owned track doesn't need to be restored in between
+        snapshot = self.copy()
+        snapshot.mission_cards = list(self.mission_cards)
+        arguments = [tuple(choice if choice != 0 else None for choice in selection) for selection in selections]
+        if workers is None:
+            workers = self.orig_board.workers
+
+        costs = []
+        rewards = []
+        if workers > 1 and len(selections) > 1:
+            executor = WORKER_POOL.get(workers, self.orig_board, self.database)
+            sent = board.detach_tracks([snapshot])[0]
+            results = executor.map(run_compute, [sent] * len(arguments), arguments,
+                                   [next(COMPUTE_CALLS)] * len(arguments))
+        else:
+            results = (snapshot.compute_optimal_track(*a, True, memo=memo) + (None,) for a in arguments) # polymerase chain reaction
+        # results arrive in order; images are rendered while the remaining selections are still being solved
+        for selection, (p, c, r, memo_stats) in zip(selections, results):
+            if memo_stats is not None:
+                memo.absorb(memo_stats)
+            name_append = str(selection[0]) + str(selection[1]) + str(selection[2])
+            visual.save(filepath + "missions_" + name_append + ".png", p, color)
+            costs.append(c)
+            rewards.append(r)
+
+        visual.flush() # images are written in the background
+        self.empty_queued_track()
+        visual.redraw()
 
         return costs, rewards
 
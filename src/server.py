@@ -0,0 +1,250 @@
+import asyncio
+import itertools
+import json
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from log import Log
+from mytrack import MyTrack
+from board import REG_HARBOR_PENALTY
+from workers import WORKER_STATE, init_worker
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SESSION = "default"
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+QUERY_ERROR = -32000
+
+
+class RecordingVisual:
+    """
+    Stands in for Visual in worker processes: keeps what a query draws so that it can be returned as JSON, and
+    every call in order so that it can be replayed on a real Visual.
+    """
+    def __init__(self):
+        self.paths = []
+        self.cities = []
+        self.images = {}
+        self.calls = []
+
+    def draw_path(self, points, color=0):
+        self.calls.append(("draw_path", (points, color)))
+        self.paths.append([list(p) for p in points])
+
+    def mark_city(self, city_loc, color=0):
+        self.calls.append(("mark_city", (city_loc, color)))
+        self.cities.append(list(city_loc))
+
+    def save(self, filename, paths, color=0):
+        self.calls.append(("save", (filename, paths, color)))
+        self.images[filename] = [[list(p) for p in path] for path in paths]
+
+    def clean(self):
+        self.calls.append(("clean", ()))
+        self.paths = []
+        self.cities = []
+
+    def redraw(self, color=0):
+        self.calls.append(("redraw", (color,)))
+        self.paths = []
+        self.cities = []
+
+    def replay(self, visual):
+        for name, args in self.calls:
+            getattr(visual, name)(*args)
+
+    def update(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+class Session:
+    """
+    State of one game: its own track, log and harbor penalty, played against the board shared by every session. It
+    stays in the worker process that runs its queries.
+    """
+    def __init__(self, board, database):
+        self.my_track = MyTrack(board, database)
+        self.log = Log(database)
+        self.harbor_penalty = REG_HARBOR_PENALTY
+
+
+def run_session_query(name, query):
+    """
+    Runs one query of session name in a worker process, on the session state the worker keeps. The session is
+    created by its first query.
+
+    :return: tuple (RecordingVisual, result dictionary, error message or None); on error the result holds the
+        traceback.
+    """
+    from main import handle_query
+    database, board = WORKER_STATE["database"], WORKER_STATE["board"]
+    sessions = WORKER_STATE.setdefault("sessions", {})
+    if name not in sessions:
+        sessions[name] = Session(board, database)
+    session = sessions[name]
+    board.harbor_penalty = session.harbor_penalty
+    visual = RecordingVisual()
+    result = {}
+    error = None
+    session.log.step()
+    try:
+        result["text"] = handle_query(database, board, session.my_track, session.log, visual,
+                                      WORKER_STATE["results_path"], query, result)
+    except Exception as e:
+        error = str(e)
+        result["traceback"] = traceback.format_exc()
+    session.harbor_penalty = board.harbor_penalty
+    result["queued"] = [[list(p) for p in path] for path in session.my_track.queued_track]
+    return visual, result, error
+
+def close_session(name):
+    """
+    :return: True if the worker held session name, which is dropped.
+    """
+    return WORKER_STATE.setdefault("sessions", {}).pop(name, None) is not None
+
+
+class QueryError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class QueryServer:
+    """
+    Answers JSON-RPC 2.0 requests, one JSON object per line, with the keywords of handle_query.
+
+    Methods: "query" (params: "query" and optionally "session") runs a query and returns its console text along
+    with the paths, cities, queued track and costs it produced; "sessions" lists the open sessions; "close"
+    (params: "session") drops one. Sessions are created by their first query.
+
+    Each session lives in one of workers single-process lanes, which keeps its track and log between queries, so a
+    query only sends its text and gets back what it produced. New sessions are given the lanes in turn, and a lane
+    runs queries in the order they arrive, so the queries of a session run one at a time.
+    """
+    def __init__(self, database, board, results_path, workers=1):
+        self.database = database
+        self.board = board
+        self.sessions = {} # lane of each open session
+        self.lanes = [ProcessPoolExecutor(max_workers=1, initializer=init_worker,
+                                          initargs=(database, board, results_path)) for _ in range(max(workers, 1))]
+        self.next_lane = itertools.count()
+
+    def session_name(self, params):
+        name = params.get("session", DEFAULT_SESSION)
+        if not isinstance(name, str):
+            raise QueryError(INVALID_PARAMS, "session must be a string.")
+        return name
+
+    async def query(self, params):
+        name = self.session_name(params)
+        query = params.get("query")
+        if not isinstance(query, str):
+            raise QueryError(INVALID_PARAMS, "query must be a string.")
+        if name not in self.sessions:
+            self.sessions[name] = self.lanes[next(self.next_lane) % len(self.lanes)]
+        loop = asyncio.get_running_loop()
+        visual, result, error = await loop.run_in_executor(self.sessions[name], run_session_query, name, query)
+        if error is not None:
+            raise QueryError(QUERY_ERROR, error)
+        result["session"] = name
+        result["paths"] = visual.paths
+        result["cities"] = visual.cities
+        result["images"] = visual.images
+        return result
+
+    async def close(self, params):
+        name = self.session_name(params)
+        lane = self.sessions.pop(name, None)
+        if lane is None:
+            return False
+        return await asyncio.get_running_loop().run_in_executor(lane, close_session, name)
+
+    async def dispatch(self, request):
+        method = request.get("method")
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            raise QueryError(INVALID_PARAMS, "params must be an object.")
+        if method == "query":
+            return await self.query(params)
+        elif method == "sessions":
+            return sorted(self.sessions)
+        elif method == "close":
+            return await self.close(params)
+        raise QueryError(METHOD_NOT_FOUND, "Unknown method " + str(method) + ".")
+
+    async def respond(self, line, writer, write_lock):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise QueryError(PARSE_ERROR, "Request is not valid JSON.")
+            if not isinstance(request, dict):
+                raise QueryError(INVALID_REQUEST, "Request must be an object.")
+            request_id = request.get("id")
+            response = {"jsonrpc": "2.0", "id": request_id, "result": await self.dispatch(request)}
+        except QueryError as error:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": error.code, "message": str(error)}}
+        except Exception as error:
+            traceback.print_exc()
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": INTERNAL_ERROR, "message": str(error)}}
+        async with write_lock:
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        # requests on one connection are answered as they complete, so responses carry the id of their request
+        write_lock = asyncio.Lock()
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(self.respond(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        writer.close()
+
+    async def serve(self, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            print("Listening on " + socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+            print("Listening on " + host + ":" + str(port))
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        for lane in self.lanes:
+            lane.shutdown()
+
+
+def run_server(database, board, results_path, socket_path=None, port=DEFAULT_PORT, workers=1):
+    """
+    Serves queries until interrupted.
+
+    :param socket_path: path of a Unix socket to listen on; if None, listens on TCP port on the local host.
+    """
+    server = QueryServer(database, board, results_path, workers)
+    try:
+        asyncio.run(server.serve(socket_path, port=port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
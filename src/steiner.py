@@ -0,0 +1,151 @@
+import heapq
+from operator import add
+
+INFINITY = float("inf")
+
+
+def steiner_tree(graph, groups, owned, step_penalty, harbor_penalty, memo=None):
+    """
+    Exact group Steiner tree by Dreyfus-Wagner dynamic programming over the compiled board graph.
+
+    dp[S][v] is the cheapest priority (build cost plus penalties, as in find_path) of a tree rooted at v that reaches
+    at least one node of every group in the subset S. Trees for S are formed by merging the trees of two
+    complementary subsets at v, then extended by a backward Dijkstra search. The work grows as 3^k * n for k groups,
+    which is fine for the handful of groups a mission selection produces.
+
+    :param groups: list of collections of node ids, one per group of terminals.
+    :param owned: bytearray from HexGraph.owned_mask(); owned nodes are free to build into from each other.
+    :param memo: optional SearchMemo to reuse the tables of subsets of groups solved before.
+    :return: tuple (list of paths as node id lists, total build cost), or (None, None) if no tree exists.
+    """
+    n = len(graph)
+    k = len(groups)
+    if k <= 1:
+        return [], 0
+    offsets, targets, costs, river, harbor, reverse = \
+        graph.offsets, graph.targets, graph.costs, graph.river, graph.harbor, graph.reverse
+
+    full = (1 << k) - 1
+    dp = [None] * (full + 1)
+    via = [None] * (full + 1)
+    if memo is not None:
+        context = (bytes(owned), step_penalty, harbor_penalty)
+        keys = [frozenset(g) for g in groups]
+    for subset in range(1, full + 1):
+        if memo is not None:
+            subset_key = frozenset(keys[i] for i in range(k) if subset >> i & 1)
+            entry = memo.get(context, subset_key)
+            if entry is not None:
+                dp[subset], via[subset] = entry
+                continue
+
+        best = [INFINITY] * n
+        if subset & (subset - 1) == 0:
+            for t in groups[subset.bit_length() - 1]:
+                best[t] = 0
+        else:
+            # merge at every node; each split is enumerated once by keeping the lowest group on the left
+            low = subset & -subset
+            rest = subset ^ low
+            sub = (rest - 1) & rest
+            while True:
+                best = list(map(min, best, map(add, dp[low | sub], dp[rest ^ sub])))
+                if sub == 0:
+                    break
+                sub = (sub - 1) & rest
+
+        # grow the trees backwards: a root u reaches v's tree by building from u into v
+        came_from = [-1] * n
+        done = bytearray(n)
+        agenda = [(d, v) for v, d in enumerate(best) if d < INFINITY]
+        heapq.heapify(agenda)
+        while agenda:
+            d, v = heapq.heappop(agenda)
+            if done[v]:
+                continue
+            done[v] = 1
+            for e in range(offsets[v], offsets[v + 1]):
+                u = targets[e]
+                if done[u]:
+                    continue
+                if owned[v]:
+                    cost = 0 if owned[u] else river[e]
+                else:
+                    cost = costs[reverse[e]]
+                if d + cost + step_penalty < best[u]:
+                    best[u] = d + cost + step_penalty
+                    came_from[u] = v
+                    heapq.heappush(agenda, (best[u], u))
+            u = harbor[v]
+            if u >= 0 and not done[u] and d + harbor_penalty < best[u]:
+                best[u] = d + harbor_penalty
+                came_from[u] = v
+                heapq.heappush(agenda, (best[u], u))
+        if memo is not None:
+            best, came_from = memo.put(context, subset_key, best, came_from)
+        dp[subset] = best
+        via[subset] = came_from
+
+    # the root is a terminal, whose own cost is not charged, like the start of a path in find_path
+    terminals = set()
+    for g in groups:
+        terminals.update(g)
+    root = min(terminals, key=lambda t: (dp[full][t], t))
+    if dp[full][root] == INFINITY:
+        return None, None
+
+    edges = {}
+    stack = [(full, root)]
+    while stack:
+        subset, v = stack.pop()
+        w = via[subset][v]
+        if w >= 0:
+            edges[(v, w)] = None
+            stack.append((subset, w))
+        elif subset & (subset - 1) != 0:
+            low = subset & -subset
+            rest = subset ^ low
+            sub = (rest - 1) & rest
+            while dp[low | sub][v] + dp[rest ^ sub][v] != dp[subset][v]:
+                sub = (sub - 1) & rest
+            stack.append((low | sub, v))
+            stack.append((rest ^ sub, v))
+
+    return tree_paths(root, edges), sum(edge_cost(graph, owned, v, w) for v, w in edges)
+
+
+def edge_cost(graph, owned, v, w):
+    """
+    :return: build cost of going from node v to node w, which are adjacent or linked by a ferry.
+    """
+    for e in range(graph.offsets[v], graph.offsets[v + 1]):
+        if graph.targets[e] == w:
+            if owned[w]:
+                return 0 if owned[v] else graph.river[e]
+            return graph.costs[e]
+    return 0
+
+
+def tree_paths(root, edges):
+    """
+    Splits a tree, given as (parent, child) edges, into paths that start at the root or at a branching node.
+    """
+    children = {}
+    for v, w in edges:
+        children.setdefault(v, []).append(w)
+    paths = []
+    seen = {root}
+    stack = [root]
+    while stack:
+        start = stack.pop()
+        for child in children.get(start, []):
+            if child in seen:
+                continue
+            path = [start, child]
+            seen.add(child)
+            while len(children.get(path[-1], [])) == 1 and children[path[-1]][0] not in seen:
+                path.append(children[path[-1]][0])
+                seen.add(path[-1])
+            paths.append(path)
+            stack.append(path[-1])
+    return paths
@@ -1,14 +1,62 @@
 import json
-from board import Board
+import hashlib
+from board import Board, REG_HARBOR_PENALTY, HIGH_HARBOR_PENALTY
+from citymatrix import load_city_matrix
+from boardcache import read_board_cache, write_board_cache, CACHE_PREFIX
+import os
 
-def load_files(city_db_path, board_path, harbor_path):
+def hash_files(*paths):
+    """
+    Computes a hash of the contents of the given files.
+
+    :return: hexadecimal digest string
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def load_files(city_db_path, board_path, harbor_path, cache_path=None):
     """
     Loads JSON database of Eurorails and ASCII map of board.
 
     :param city_db_path: path to city/load database
     :param board_path: path to ASCII board text file
+    :param cache_path: directory for precomputed data, e.g. the compiled board and the city distance matrix; None to
+        skip precomputation
     :return: database as a dictionary
     """
+    key = hash_files(city_db_path, board_path, harbor_path)
+    if cache_path is None:
+        city_db, board = parse_files(city_db_path, board_path, harbor_path)
+    else:
+        # read the compiled board if it was written for the same source files, or compile and write it
+        filename = os.path.join(cache_path, CACHE_PREFIX + key + ".bin")
+        cached = read_board_cache(filename, key)
+        if cached is not None:
+            city_db, board = cached
+        else:
+            city_db, board = parse_files(city_db_path, board_path, harbor_path)
+            os.makedirs(cache_path, exist_ok=True)
+            write_board_cache(filename, key, city_db, board)
+
+    board.version = key
+
+    # load or compute city-to-city paths on the empty board
+    if cache_path is not None:
+        board.city_matrix = load_city_matrix(city_db, board, (REG_HARBOR_PENALTY, HIGH_HARBOR_PENALTY), cache_path,
+                                             key)
+
+    return city_db, board
+
+def parse_files(city_db_path, board_path, harbor_path):
+    """
+    Parses the database and board files and compiles the board's search graph.
+
+    :return: tuple (database, Board)
+    """
     board = []
     harbors = {}
 
@@ -41,6 +89,7 @@ def load_files(city_db_path, board_path, harbor_path):
         harbors[(int(expand[4]), int(expand[5]))] = ((int(expand[1]), int(expand[2])), int(expand[6]))
 
     board = Board(board, harbors, min_x, max_x, min_y, max_y)
+    board.compile()
 
     return city_db, board
 
@@ -1,8 +1,53 @@
-from PIL import Image, ImageDraw, ImageTk
-import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
 from board import is_one_step
 
+WRITER_THREADS = 2
+MAX_PENDING_IMAGES = 8
+
+
+class ImageWriter:
+    """
+    Encodes and writes PNG images on background threads, so that rendering can go on in the meantime. At most
+    max_pending images wait to be written; save() blocks until one is done when there are more.
+    """
+    def __init__(self, threads=WRITER_THREADS, max_pending=MAX_PENDING_IMAGES):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.slots = BoundedSemaphore(max_pending)
+        self.pending = []
+
+    def save(self, image, filename):
+        """
+        :param image: image that is no longer drawn on.
+        """
+        self.slots.acquire()
+        future = self.executor.submit(image.save, filename, "PNG")
+        future.add_done_callback(lambda f: self.slots.release())
+        self.pending = [f for f in self.pending if not f.done()] + [future]
+
+    def flush(self):
+        """
+        Waits for every image to be written; raises the first error of a failed write.
+        """
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+
+
 class Visual:
+    """
+    Map of the board with paths and cities drawn on it, shown in a tkinter window.
+
+    The map is drawn in layers: the decoded and resized board image (base), a copy of it with the saved paths of the
+    log drawn on (saved), and the displayed image (board), a copy of saved that queries draw on. The saved layer is
+    only redrawn when the log changes, so clearing queries off the map is a single image copy.
+    """
     LINE_THICKNESS = 2
     CIRCLE_THICKNESS = 2
     RADIUS = 6
@@ -36,22 +81,64 @@ class Visual:
                  }
     X_CONST = (16.21, -0.1)
     Y_CONST = (8.0645, 14.03)
+    PICK_CELL = 16 # side of the square buckets of the pixel to hex index, about one hex wide
+    PICK_RADIUS = 10 # farthest a pixel can be from a hex center and still pick it
 
-    def __init__(self, board_file, log):
+    def __init__(self, board_file, log, board=None):
+        """
+        :param board: Board whose valid points get their pixel coordinates precomputed; others are computed on use.
+        """
         self.filepath = board_file
-        self.board = Image.open(self.filepath)
-        self.board = self.board.resize((4096 // 4, 3281 // 4), Image.ANTIALIAS)
-        self.draw = ImageDraw.Draw(self.board)
+        self.base = None
+        self.saved = None
+        self.saved_key = None
+        self.board = None
+        self.draw = None
+        self.writer = ImageWriter()
+        self.open_window()
+
+        # changes not yet shown in the window: the whole image, or the bounding box of what was drawn
+        self.dirty_all = False
+        self.dirty_box = None
+
+        self.log = log
+
+        # pixel coordinates of every valid point, and the points in each PICK_CELL bucket of pixels
+        self.pixels = {}
+        self.pick_index = {}
+        if board is not None:
+            for x in range(board.min_x, board.max_x + 1):
+                for y in range(board.min_y, board.max_y + 1):
+                    if board.is_valid(x, y):
+                        pixel = Visual.compute_pixels((x, y))
+                        self.pixels[(x, y)] = pixel
+                        bucket = (pixel[0] // Visual.PICK_CELL, pixel[1] // Visual.PICK_CELL)
+                        self.pick_index.setdefault(bucket, []).append((x, y))
+
+    def load(self):
+        """
+        Decodes and resizes the board image on first use, so that runs which never draw don't load PIL.
+        """
+        if self.base is None:
+            from PIL import Image
+
+            self.base = Image.open(self.filepath)
+            self.base = self.base.resize((4096 // 4, 3281 // 4), Image.LANCZOS)
+            self.saved = self.base
+            self.show(self.base)
+
+    def open_window(self):
+        import tkinter as tk
+        from PIL import ImageTk
 
-        # Create tkinter window
+        self.load()
         self.window = tk.Tk()
         self.tk_img = ImageTk.PhotoImage(self.board)
         self.panel = tk.Label(self.window, image=self.tk_img)
         self.panel.pack(side="bottom", fill="both", expand="yes")
-        
-        self.log = log
 
     def draw_path(self, points, color=0):
+        self.load()
         for i in range(len(points) - 1):
             p1 = points[i]
             p2 = points[i + 1]
@@ -59,9 +146,14 @@ class Visual:
                 p1 = self.coordinates_to_pixels(p1)
                 p2 = self.coordinates_to_pixels(p2)
                 self.draw.line([p1, p2], fill=color, width=Visual.LINE_THICKNESS)
+                self.mark_dirty(min(p1[0], p2[0]) - Visual.LINE_THICKNESS, min(p1[1], p2[1]) - Visual.LINE_THICKNESS,
+                                max(p1[0], p2[0]) + Visual.LINE_THICKNESS, max(p1[1], p2[1]) + Visual.LINE_THICKNESS)
 
     def mark_city(self, city_loc, color=0):
+        self.load()
         city_loc = self.coordinates_to_pixels(city_loc)
+        extent = Visual.RADIUS + Visual.CIRCLE_THICKNESS
+        self.mark_dirty(city_loc[0] - extent, city_loc[1] - extent, city_loc[0] + extent, city_loc[1] + extent)
         for i in range(Visual.RADIUS, Visual.RADIUS + Visual.CIRCLE_THICKNESS):
             self.draw.ellipse((city_loc[0] - i, city_loc[1] - i, city_loc[0] + (i - 1), city_loc[1] + (i - 1)),
                               outline=color)
@@ -72,25 +164,95 @@ class Visual:
                               outline=color)
 
     def clean(self):
-        self.board = Image.open(self.filepath)
-        self.board = self.board.resize((4096 // 4, 3281 // 4), Image.ANTIALIAS)
+        """
+        Removes everything drawn, including the saved paths, until the next redraw.
+        """
+        self.load()
+        self.saved = self.base
+        self.saved_key = None
+        self.show(self.base)
+
+    def show(self, layer):
+        from PIL import ImageDraw
+
+        self.board = layer.copy()
         self.draw = ImageDraw.Draw(self.board)
+        self.dirty_all = True
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        """
+        Adds a rectangle of pixels to the area update() has to push to the window.
+        """
+        if self.dirty_box is not None:
+            x0, y0 = min(x0, self.dirty_box[0]), min(y0, self.dirty_box[1])
+            x1, y1 = max(x1, self.dirty_box[2]), max(y1, self.dirty_box[3])
+        self.dirty_box = (max(x0, 0), max(y0, 0), min(x1, self.board.size[0]), min(y1, self.board.size[1]))
 
     def update(self):
-        self.tk_img = ImageTk.PhotoImage(self.board)
-        self.panel.configure(image=self.tk_img)
+        """
+        Shows the changes since the last update: the whole image after a clean or redraw, only the bounding box of
+        the new paths and cities otherwise, and nothing if the map is unchanged.
+        """
+        from PIL import ImageTk
+
+        if self.dirty_all:
+            self.tk_img.paste(self.board)
+        elif self.dirty_box is not None and self.dirty_box[0] < self.dirty_box[2] and \
+                self.dirty_box[1] < self.dirty_box[3]:
+            patch = ImageTk.PhotoImage(self.board.crop(self.dirty_box))
+            self.window.tk.call(str(self.tk_img), "copy", str(patch), "-to", self.dirty_box[0], self.dirty_box[1])
+        self.dirty_all = False
+        self.dirty_box = None
         self.window.update()
 
     def save(self, filename, paths, color):
+        """
+        Draws paths on the map and writes it to filename in the background; see flush().
+        """
+        self.load()
         for p in paths:
             self.draw_path(p, color)
-        self.board.save(filename, "PNG")
-        self.clean()
+        self.writer.save(self.board, filename)
+        self.show(self.saved)
+
+    def flush(self):
+        """
+        Waits until every image passed to save() is written.
+        """
+        self.writer.flush()
 
     def quit(self):
+        self.writer.close()
         self.window.quit()
 
     def coordinates_to_pixels(self, coords):
+        pixel = self.pixels.get(tuple(coords))
+        return pixel if pixel is not None else Visual.compute_pixels(coords)
+
+    def pixels_to_coordinates(self, pixel):
+        """
+        Finds the valid point whose center is nearest to a pixel, e.g. for picking points with the mouse.
+
+        :return: coordinates of the point, or None if no center is within PICK_RADIUS pixels.
+        """
+        bucket_x, bucket_y = pixel[0] // Visual.PICK_CELL, pixel[1] // Visual.PICK_CELL
+        closest = None
+        closest_distance = Visual.PICK_RADIUS ** 2
+        for bx in range(bucket_x - 1, bucket_x + 2):
+            for by in range(bucket_y - 1, bucket_y + 2):
+                for coords in self.pick_index.get((bx, by), ()):
+                    center = self.pixels[coords]
+                    distance = (center[0] - pixel[0]) ** 2 + (center[1] - pixel[1]) ** 2
+                    if distance <= closest_distance:
+                        closest = coords
+                        closest_distance = distance
+        return closest
+
+    @staticmethod
+    def compute_pixels(coords):
+        """
+        :return: pixel coordinates of a point, extrapolated from the nearest of the reference points.
+        """
         def get_closest_reference(coords):
             def distance(p1, p2):
                 return abs(p2[1] - p1[1]) + abs(p2[0] - p1[0])
@@ -111,10 +273,35 @@ class Visual:
         return tuple(pixel)
 
     def redraw(self, color=0):
-        self.clean()
-        for query in self.log:
-            for action, location in query[1]:
-                if action == "path":
-                    self.draw_path(location, color)
-                elif action == "city":
-                    self.mark_city(location, color)
\ No newline at end of file
+        """
+        Clears queries off the map, leaving the saved paths of the log, which are redrawn if the log has changed.
+        """
+        self.load()
+        key = (self.log.version, color)
+        if key != self.saved_key:
+            self.show(self.base)
+            for query in self.log:
+                for action, location in query[1]:
+                    if action == "path":
+                        self.draw_path(location, color)
+                    elif action == "city":
+                        self.mark_city(location, color)
+            self.saved = self.board.copy()
+            self.saved_key = key
+        self.show(self.saved)
+
+
+class HeadlessVisual(Visual):
+    """
+    Visual without a window, for running on machines without a display: the map is only rendered into the images
+    written by save().
+    """
+    def open_window(self):
+        pass
+
+    def update(self):
+        self.dirty_all = False
+        self.dirty_box = None
+
+    def quit(self):
+        self.writer.close()
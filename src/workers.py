@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+
+WORKER_STATE = {}
+
+
+def init_worker(database, board, results_path):
+    """
+    Process pool initializer shared by every pool: keeps the loaded database and board in the worker for its whole
+    life, so tasks only carry the state of their own query.
+    """
+    board.workers = 1 # work already runs in parallel across workers
+    WORKER_STATE["database"] = database
+    WORKER_STATE["board"] = board
+    WORKER_STATE["results_path"] = results_path
+
+
+class WorkerPool:
+    """
+    Process pool shared by the greedy restarts of connect_cities, the selections of compute_all and the queries of
+    file batches. It is started on first use and kept for the whole session, so the board is sent to each worker
+    once; a new pool is started when the board is reloaded or the number of workers changes.
+    """
+    def __init__(self):
+        self.executor = None
+        self.workers = 0
+        self.database = None
+        self.board = None
+        self.results_path = None
+
+    def get(self, workers, board, database=None, results_path=None):
+        """
+        :param database: database the tasks need, if any; None keeps the one the workers hold.
+        :param results_path: results directory the tasks need, if any; None keeps the one the workers hold.
+        :return: ProcessPoolExecutor whose workers hold board, database and results_path.
+        """
+        if self.board is board:
+            database = database if database is not None else self.database
+            results_path = results_path if results_path is not None else self.results_path
+        if self.executor is None or self.workers != workers or self.board is not board or \
+                self.database is not database or self.results_path != results_path:
+            self.shutdown()
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(database, board, results_path))
+            self.workers = workers
+            self.database = database
+            self.board = board
+            self.results_path = results_path
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.executor = None
+        self.database = None
+        self.board = None
+        self.results_path = None
+
+
+WORKER_POOL = WorkerPool()
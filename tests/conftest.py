@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DATABASE = os.path.join(SRC, "..", "database")
+sys.path.insert(0, SRC)
+
+from utils import load_files
+
+
+def database_paths():
+    """
+    :return: tuple (database, board, harbors) paths of the files shipped with the repository.
+    """
+    return os.path.join(DATABASE, "eurorails.json"), os.path.join(DATABASE, "board_ascii.txt"), \
+        os.path.join(DATABASE, "harbors.txt")
+
+@pytest.fixture(scope="session")
+def loaded():
+    return load_files(*database_paths())
+
+def coords(database, city):
+    return database["cities"][city]["coords"]
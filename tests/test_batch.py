@@ -0,0 +1,47 @@
+import random
+
+from batch import BatchRunner
+from cache import PATH_CACHE
+from log import Log
+from mytrack import MyTrack
+from server import RecordingVisual
+from workers import WORKER_POOL
+
+QUERIES = ["city paris wien", "load wheat", "mission wheat wien all", "path paris wien", "path london madrid berlin",
+           "mission wine london best", "add mission* wine berlin", "mission coal roma", "bogus query", "load wine",
+           "path milano hamburg", "mission wheat wien best", "city london", "path london madrid berlin"]
+
+
+def run_batch(loaded, capsys, workers):
+    """
+    :return: everything the queries leave behind: console output, drawings, track, log, random state and path cache.
+    """
+    database, eurorails_board = loaded
+    PATH_CACHE.clear()
+    random.seed(5)
+    my_track, log, visual = MyTrack(eurorails_board, database), Log(database), RecordingVisual()
+    capsys.readouterr()
+    try:
+        number = BatchRunner(database, eurorails_board, None, workers).run(database, eurorails_board, my_track, log,
+                                                                          visual, QUERIES, 1)
+    finally:
+        WORKER_POOL.shutdown()
+    return (number, capsys.readouterr().out, repr(visual.calls), my_track.fingerprint(), my_track.queued_track,
+            log.query_log, random.getstate(), list(PATH_CACHE.entries.items()))
+
+
+def test_parallel_batch_matches_serial(loaded, capsys, monkeypatch):
+    serial = run_batch(loaded, capsys, 1)
+    assert serial[0] == len(QUERIES) + 1
+    assert "ERROR: Query could not be processed." in serial[1]
+
+    searched = []
+    run_serial = BatchRunner.run_serial
+    def counting(self, *args):
+        searched.append(args[5])
+        return run_serial(self, *args)
+    monkeypatch.setattr(BatchRunner, "run_serial", counting)
+    assert run_batch(loaded, capsys, 3) == serial
+    # the saving and failing queries run in the console process, most of the others in the workers
+    assert "add mission* wine berlin" in searched and "bogus query" in searched
+    assert len(searched) < len(QUERIES) // 2
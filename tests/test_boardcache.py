@@ -0,0 +1,66 @@
+import os
+
+import boardcache
+from boardcache import read_board_cache, write_board_cache, PREAMBLE, MAGIC, CACHE_VERSION
+import citymatrix
+from citymatrix import CityMatrix
+from board import REG_HARBOR_PENALTY, HIGH_HARBOR_PENALTY
+from utils import load_files, parse_files, hash_files
+from conftest import database_paths
+
+GRAPH_ARRAYS = ("offsets", "targets", "costs", "river", "harbor", "reverse")
+
+
+def cache_files(cache_path):
+    key = hash_files(*database_paths())
+    return os.path.join(cache_path, boardcache.CACHE_PREFIX + key + ".bin"), \
+        os.path.join(cache_path, citymatrix.CACHE_PREFIX + key + ".pickle"), key
+
+def assert_same_board(database, board, fresh_database, fresh_board):
+    assert database == fresh_database
+    assert board.board == fresh_board.board and board.harbors == fresh_board.harbors
+    assert (board.min_x, board.max_x, board.min_y, board.max_y) == \
+        (fresh_board.min_x, fresh_board.max_x, fresh_board.min_y, fresh_board.max_y)
+    assert board.graph.coords == fresh_board.graph.coords
+    for name in GRAPH_ARRAYS:
+        assert getattr(board.graph, name) == getattr(fresh_board.graph, name)
+
+
+def test_cache_round_trip(tmp_path):
+    fresh_database, fresh_board = parse_files(*database_paths())
+    _, cold_board = load_files(*database_paths(), str(tmp_path))
+    board_file, matrix_file, _ = cache_files(str(tmp_path))
+    assert os.path.exists(board_file) and os.path.exists(matrix_file)
+
+    database, board = load_files(*database_paths(), str(tmp_path))
+    assert_same_board(database, board, fresh_database, fresh_board)
+    assert board.version == cold_board.version
+
+    fresh_matrix = CityMatrix(fresh_database, fresh_board, (REG_HARBOR_PENALTY, HIGH_HARBOR_PENALTY))
+    for name in ("settings", "cities", "costs", "priorities", "parents"):
+        assert getattr(board.city_matrix, name) == getattr(fresh_matrix, name)
+
+def test_stale_or_corrupt_cache_is_rebuilt(tmp_path):
+    fresh_database, fresh_board = parse_files(*database_paths())
+    board_file, matrix_file, key = cache_files(str(tmp_path))
+    write_board_cache(board_file, key, fresh_database, fresh_board)
+    assert read_board_cache(board_file, key) is not None
+    assert read_board_cache(board_file, "other source files") is None
+
+    with open(board_file, "rb") as f:
+        data = bytearray(f.read())
+    PREAMBLE.pack_into(data, 0, MAGIC, CACHE_VERSION + 1, PREAMBLE.unpack_from(data)[2])
+    with open(board_file, "wb") as f:
+        f.write(data)
+    assert read_board_cache(board_file, key) is None
+
+    # a truncated board file and a garbled matrix are replaced with fresh ones
+    with open(board_file, "wb") as f:
+        f.write(bytes(data[:PREAMBLE.size + 10]))
+    with open(matrix_file, "wb") as f:
+        f.write(b"not a pickle")
+    assert read_board_cache(board_file, key) is None
+    database, board = load_files(*database_paths(), str(tmp_path))
+    assert_same_board(database, board, fresh_database, fresh_board)
+    assert board.city_matrix.has(REG_HARBOR_PENALTY)
+    assert read_board_cache(board_file, key) is not None
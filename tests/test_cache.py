@@ -0,0 +1,51 @@
+from board import find_path_to, connect_cities, REG_HARBOR_PENALTY, HIGH_HARBOR_PENALTY
+from cache import PATH_CACHE, LRUCache
+from mytrack import Track
+from conftest import coords
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    cache.resize(0)
+    cache.put("d", 4)
+    assert cache.get("d") is None
+
+def test_cached_path_follows_owned_track(loaded):
+    database, eurorails_board = loaded
+    PATH_CACHE.clear()
+    track = Track(eurorails_board)
+    start, end = coords(database, "london"), coords(database, "wien")
+    path, cost = find_path_to(start, [end], eurorails_board, track)
+    hits = PATH_CACHE.hits
+    assert find_path_to(start, [end], eurorails_board, track) == (path, cost)
+    assert PATH_CACHE.hits == hits + 1
+
+    # owning part of the route makes it cheaper, so the cached answer must not be returned
+    track.add_track(path[len(path) // 2:])
+    _, owned_cost = find_path_to(start, [end], eurorails_board, track)
+    assert PATH_CACHE.hits == hits + 1
+    assert owned_cost < cost
+
+    track.clean()
+    assert find_path_to(start, [end], eurorails_board, track) == (path, cost)
+
+def test_cached_connection_follows_harbor_penalty(loaded):
+    database, eurorails_board = loaded
+    PATH_CACHE.clear()
+    cities = [[coords(database, "dublin")], [coords(database, "paris")], [coords(database, "wien")]]
+    paths, cost = connect_cities(eurorails_board, None, cities, len(cities))
+    hits = PATH_CACHE.hits
+    assert connect_cities(eurorails_board, None, cities, len(cities)) == (paths, cost)
+    assert PATH_CACHE.hits == hits + 1
+
+    eurorails_board.harbor_penalty = HIGH_HARBOR_PENALTY
+    try:
+        connect_cities(eurorails_board, None, cities, len(cities))
+    finally:
+        eurorails_board.harbor_penalty = REG_HARBOR_PENALTY
+    assert PATH_CACHE.hits == hits + 1
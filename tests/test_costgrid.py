@@ -0,0 +1,47 @@
+import pytest
+
+from board import find_path
+from graph import DETERMINISTIC_TIES
+from conftest import coords
+
+pytest.importorskip("numpy")
+from costgrid import CostGrid, TERRAIN_CODES
+
+
+def test_terrain_matches_board(loaded):
+    _, eurorails_board = loaded
+    grid = CostGrid(eurorails_board)
+    for x in range(eurorails_board.min_x, eurorails_board.max_x + 1):
+        for y in range(eurorails_board.min_y, eurorails_board.max_y + 1):
+            r, c = grid.index((x, y))
+            if not (0 <= r < grid.shape[0] and 0 <= c < grid.shape[1]):
+                assert not eurorails_board.is_valid(x, y)
+                continue
+            assert grid.valid[r, c] == eurorails_board.is_valid(x, y)
+            if eurorails_board.is_valid(x, y):
+                assert grid.terrain[r, c] == TERRAIN_CODES[eurorails_board(x, y)]
+
+def test_validate_paths_matches_scalar_check(loaded, monkeypatch):
+    database, eurorails_board = loaded
+    paths = []
+    for c1, c2 in [("dublin", "paris"), ("london", "wien"), ("oslo", "napoli")]:
+        goal = coords(database, c2)
+        path, _ = find_path(coords(database, c1), eurorails_board, None, lambda p: p == goal, ties=DETERMINISTIC_TIES)
+        paths.append(path)
+    harbor, (other, _) = next(iter(eurorails_board.harbors.items()))
+    x, y = paths[1][0]
+    paths += [
+        [],
+        [harbor, other], # across a ferry
+        [harbor, (other[0] + 3, other[1])], # a jump from a harbor that is not its ferry
+        paths[1][:3] + paths[1][5:], # skips points
+        [(x, y), (x + 1, y + 1)], # not adjacent on the hex grid
+        [(eurorails_board.min_x - 2, y)], # off the grid
+        [(x, eurorails_board.max_y + 2), (x, eurorails_board.max_y + 1)],
+    ]
+    result = eurorails_board.validate_paths(paths)
+    monkeypatch.setattr(eurorails_board, "get_cost_grid", lambda: None)
+    expected = eurorails_board.validate_paths(paths)
+    assert result == expected
+    assert expected[:5] == [True, True, True, True, True]
+    assert not any(expected[5:])
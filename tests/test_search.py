@@ -0,0 +1,204 @@
+import heapq
+import itertools
+import pytest
+
+from board import find_path, find_paths_to, connect_cities, connect_exact, GREEDY, HIGH_HARBOR_PENALTY, \
+    REG_HARBOR_PENALTY
+from graph import DETERMINISTIC_TIES
+from mytrack import Track, MyTrack
+from log import Log
+from server import RecordingVisual
+from conftest import coords
+import main
+
+CITY_PAIRS = [("paris", "ruhr"), ("madrid", "berlin"), ("lisboa", "stockholm"), ("london", "wien"),
+              ("dublin", "milano"), ("sevilla", "kaliningrad")]
+OWNED_PAIR = ("paris", "wien")
+
+
+def owned_track(database, eurorails_board, track_class=Track):
+    """
+    :return: track of the given class holding a path between OWNED_PAIR.
+    """
+    track = track_class(eurorails_board) if track_class is Track else track_class(eurorails_board, database)
+    goal = coords(database, OWNED_PAIR[1])
+    path, _ = find_path(coords(database, OWNED_PAIR[0]), eurorails_board, None, lambda p: p == goal,
+                        ties=DETERMINISTIC_TIES)
+    track.add_track(path)
+    return track
+
+def reference_search(start, goal, eurorails_board, my_track):
+    """
+    The search of the original find_path, read straight off the ASCII map with Board.compute_cost.
+
+    :return: tuple (priority, build cost) of the goal.
+    """
+    owned = my_track if my_track is not None else set()
+    counter = itertools.count()
+    agenda = [(0, next(counter), start, 0)]
+    done = set()
+    while agenda:
+        priority, _, (x, y), build = heapq.heappop(agenda)
+        if (x, y) in done:
+            continue
+        done.add((x, y))
+        if (x, y) == goal:
+            return priority, build
+        penalty = priority - build
+        for dx, dy in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)):
+            n = (x + dx, y + dy)
+            if not eurorails_board.is_valid(*n) or n in done:
+                continue
+            if eurorails_board.is_harbor(x, y) and eurorails_board.is_harbor(*n):
+                continue
+            cost = eurorails_board.compute_cost((x, y), n, owned)
+            heapq.heappush(agenda, (build + cost + penalty + eurorails_board.step_penalty, next(counter), n,
+                                    build + cost))
+        if eurorails_board.is_harbor(x, y):
+            n = eurorails_board.get_other_harbor(x, y)
+            heapq.heappush(agenda, (priority + eurorails_board.harbor_penalty, next(counter), n, build))
+    return None, None
+
+def search_priority(path, cost, eurorails_board):
+    """
+    :return: priority of a path found by find_path: its build cost plus a step or harbor penalty per move.
+    """
+    penalty = 0
+    for (x1, y1), (x2, y2) in zip(path[:-1], path[1:]):
+        if eurorails_board.is_harbor(x1, y1) and eurorails_board.get_other_harbor(x1, y1) == (x2, y2):
+            penalty += eurorails_board.harbor_penalty
+        else:
+            penalty += eurorails_board.step_penalty
+    return cost + penalty
+
+
+@pytest.mark.parametrize("c1, c2", CITY_PAIRS)
+@pytest.mark.parametrize("owned", [False, True])
+def test_find_path_matches_reference(loaded, c1, c2, owned):
+    database, eurorails_board = loaded
+    track = owned_track(database, eurorails_board) if owned else None
+    start, goal = coords(database, c1), coords(database, c2)
+    path, cost = find_path(start, eurorails_board, track, lambda p: p == goal, ties=DETERMINISTIC_TIES)
+    a_path, a_cost = find_path(start, eurorails_board, track, lambda p: p == goal, ties=DETERMINISTIC_TIES,
+                               goals=[goal])
+    priority, build = reference_search(start, goal, eurorails_board, track)
+    assert path[0] == start and path[-1] == goal
+    assert search_priority(path, cost, eurorails_board) == pytest.approx(priority)
+    assert search_priority(a_path, a_cost, eurorails_board) == pytest.approx(priority)
+    assert (cost, a_cost) == (build, build)
+
+def test_find_path_matches_reference_with_high_harbor_penalty(loaded):
+    database, eurorails_board = loaded
+    start, goal = coords(database, "dublin"), coords(database, "paris")
+    eurorails_board.harbor_penalty = HIGH_HARBOR_PENALTY
+    try:
+        _, cost = find_path(start, eurorails_board, None, lambda p: p == goal, ties=DETERMINISTIC_TIES)
+        _, build = reference_search(start, goal, eurorails_board, None)
+    finally:
+        eurorails_board.harbor_penalty = REG_HARBOR_PENALTY
+    assert cost == build
+
+@pytest.mark.parametrize("track_class", [Track, MyTrack])
+def test_copy_keeps_owned_track(loaded, track_class):
+    database, eurorails_board = loaded
+    track = owned_track(database, eurorails_board, track_class)
+    copy = track.copy()
+    assert copy.has_track
+    assert list(copy.points()) == list(track.points())
+    assert copy.fingerprint() == track.fingerprint()
+    assert eurorails_board.graph.owned_mask(copy) == eurorails_board.graph.owned_mask(track)
+
+    # the copy searches from the owned track like the original, and changing it leaves the original alone
+    start, goal = coords(database, "london"), set(track.points())
+    assert find_path(start, eurorails_board, copy, lambda p: p in goal, ties=DETERMINISTIC_TIES)[1] == \
+        find_path(start, eurorails_board, track, lambda p: p in goal, ties=DETERMINISTIC_TIES)[1]
+    copy.clean()
+    assert track.has_track and not copy.has_track
+
+@pytest.mark.parametrize("load, end_city", [("wine", "stockholm"), ("machinery", "madrid")])
+def test_mission_all_matches_separate_searches(loaded, load, end_city):
+    database, eurorails_board = loaded
+    goal = coords(database, end_city)
+    starts = [coords(database, c) for c in database["loads"][load]]
+    results = find_paths_to(starts, goal, eurorails_board, None, ties=DETERMINISTIC_TIES, stats={})
+    for start, (path, cost) in zip(starts, results):
+        _, separate = find_path(start, eurorails_board, None, lambda p: p == goal, ties=DETERMINISTIC_TIES)
+        assert cost == separate
+        assert path[0] == start and path[-1] == goal
+
+@pytest.mark.parametrize("groups", [["paris", "wien"], ["paris", "wien", "coal"], ["oslo", "wine", "napoli", "cattle"]])
+def test_exact_connect_is_optimal(loaded, groups):
+    database, eurorails_board = loaded
+    cities = [[coords(database, c) for c in database["loads"][g]] if g in database["loads"] else [coords(database, g)]
+              for g in groups]
+    paths, cost = connect_exact(eurorails_board, None, cities)
+    _, greedy = connect_cities(eurorails_board, None, cities, len(cities), GREEDY, stats={}, seed=0)
+    assert cost <= greedy
+    if len(groups) == 2:
+        goal = set(cities[1])
+        assert cost == find_path(cities[0], eurorails_board, None, lambda p: p in goal, ties=DETERMINISTIC_TIES)[1]
+
+    # the tree reaches every group, and its paths are connected to each other
+    track = Track(eurorails_board)
+    for path in paths:
+        track.add_track(path)
+    assert all(any(c in track for c in group) for group in cities)
+    assert len(track.components()) == 1
+
+def test_bitset_contains(loaded):
+    database, eurorails_board = loaded
+    track = Track(eurorails_board)
+    track.add_track([(0, 0), (1, 0), (1, 1)])
+    assert (0, 0) in track and (1, 1) in track and (2, 2) not in track
+    assert (0, 0, 1, 0) in track and (1, 0, 0, 1) in track # edges as (x, y, dx, dy)
+    assert (0, 0, 0, 1) not in track
+    assert not (track.min_x - 5, 0) in track # off the grid
+    other = Track(eurorails_board)
+    other.add_track([(5, 5), (5, 6)])
+    track.union(other)
+    assert (5, 6) in track and (5, 5, 0, 1) in track and (0, 0, 1, 0) in track
+    track.clean()
+    assert (0, 0) not in track and not track.has_track
+
+def test_snapshot_restore(loaded):
+    database, eurorails_board = loaded
+    track = owned_track(database, eurorails_board)
+    snapshot = track.snapshot()
+    points, fingerprint = list(track.points()), track.fingerprint()
+    goal = coords(database, "madrid")
+    path, _ = find_path(coords(database, "london"), eurorails_board, None, lambda p: p == goal,
+                        ties=DETERMINISTIC_TIES)
+    track.add_track(path)
+    assert track.fingerprint() != fingerprint
+    track.restore(snapshot)
+    assert list(track.points()) == points and track.fingerprint() == fingerprint and track.has_track
+
+def test_undo_restores_previous_track(loaded):
+    database, eurorails_board = loaded
+    my_track, log = MyTrack(eurorails_board, database), Log(database)
+    fingerprints = []
+    for c1, c2 in CITY_PAIRS[:2]:
+        goal = coords(database, c2)
+        path, _ = find_path(coords(database, c1), eurorails_board, my_track, lambda p: p == goal,
+                            ties=DETERMINISTIC_TIES)
+        my_track.append_to_queue(path)
+        my_track.save_queued_track(log, True)
+        log.step()
+        fingerprints.append(my_track.fingerprint())
+    first = fingerprints[0]
+    main.undo(my_track, log, RecordingVisual())
+    assert my_track.fingerprint() == first
+
+    # the snapshot gives the same track as replaying the log
+    replayed = MyTrack(eurorails_board, database)
+    replayed.add_from_log(log)
+    assert replayed.fingerprint() == first
+
+def test_astar_with_many_goal_points_matches_dijkstra(loaded):
+    database, eurorails_board = loaded
+    track = owned_track(database, eurorails_board)
+    goal = set(track.points())
+    start = coords(database, "madrid")
+    _, cost = find_path(start, eurorails_board, None, lambda p: p in goal, ties=DETERMINISTIC_TIES)
+    _, a_cost = find_path(start, eurorails_board, None, lambda p: p in goal, ties=DETERMINISTIC_TIES, goals=[track])
+    assert a_cost == cost
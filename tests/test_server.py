@@ -0,0 +1,60 @@
+import asyncio
+import json
+import pytest
+
+from server import QueryServer, INVALID_PARAMS, INTERNAL_ERROR, QUERY_ERROR
+
+
+class Writer:
+    """
+    Collects the responses QueryServer.respond writes.
+    """
+    def __init__(self):
+        self.responses = []
+
+    def write(self, data):
+        self.responses.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+
+def call(server, method, **params):
+    writer = Writer()
+    request = json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+    asyncio.run(server.respond(request, writer, asyncio.Lock()))
+    return writer.responses[0]
+
+
+@pytest.fixture
+def server(loaded):
+    database, eurorails_board = loaded
+    server = QueryServer(database, eurorails_board, None, workers=2)
+    yield server
+    server.shutdown()
+
+
+def test_sessions_keep_their_own_track(server):
+    path = call(server, "query", session="a", query="path* paris wien")["result"]
+    assert path["cost"] > 0 and path["paths"] and not path["queued"]
+    # the saved track and log stay in the worker of session a between queries
+    assert "1: path" in call(server, "query", session="a", query="print log")["result"]["text"]
+    assert call(server, "query", session="b", query="print log")["result"]["text"] == ""
+    assert call(server, "sessions")["result"] == ["a", "b"]
+
+    assert call(server, "close", session="a")["result"] is True
+    assert call(server, "close", session="a")["result"] is False
+    assert call(server, "sessions")["result"] == ["b"]
+    assert call(server, "query", session="a", query="print log")["result"]["text"] == ""
+
+def test_errors(server, monkeypatch):
+    assert call(server, "close", session=5)["error"]["code"] == INVALID_PARAMS
+    assert call(server, "query", session="a", query=["path"])["error"]["code"] == INVALID_PARAMS
+    assert call(server, "query", session="a", query="fly paris")["error"] == \
+        {"code": QUERY_ERROR, "message": "Query could not be processed."}
+
+    async def fail(request):
+        raise RuntimeError("worker died")
+    monkeypatch.setattr(server, "dispatch", fail)
+    error = call(server, "sessions")["error"]
+    assert error == {"code": INTERNAL_ERROR, "message": "worker died"}